@@ -1,324 +1,19 @@
 import streamlit as st
-import pandas as pd
-import requests
-import re
 import time
-import json
-from bs4 import BeautifulSoup
-from urllib.parse import unquote, urljoin
-import tldextract
-from difflib import SequenceMatcher
 
-IGNORE_DOMAINS = ["wix.com", "domain.com", "example.com", "sentry.io", "wixpress.com", "squarespace.com", "wordpress.com", "shopify.com"]
+from fs_em.config import (MAX_CONCURRENCY, PER_HOST_LIMIT, REQUEST_TIMEOUT, HTTP2_AVAILABLE, PARSE_WORKERS,
+                          JOB_REFRESH_INTERVAL, SITE_TIME_BUDGET, RESULTS_PAGE_SIZE, JOB_UNIT_SIZE, THROUGHPUT_WINDOW)
+from fs_em.inputs import normalize_website, google_sheet_csv_url
+from fs_em.jobs import open_journal, start_job, spawn_worker
 
-COMMON_EMAIL_DOMAINS = ["gmail.com", "yahoo.com", "outlook.com", "hotmail.com", "aol.com", "icloud.com", 
-                        "protonmail.com", "mail.com", "zoho.com", "yandex.com", "gmx.com"]
-CONTACT_PAGES = ["/contact", "/contact-us", "/contact.html", "/contact-us.html", "/about", "/about-us", 
-                "/about.html", "/about-us.html", "/get-in-touch", "/reach-us", "/connect", "/reach-out",
-                "/our-team", "/team", "/support", "/help", "/info"]
-
-# Function to validate and clean email addresses
-def validate_email(email):
-    # Clean and validate the email format
-    email = email.strip().lower()
-    
-    # Ignore image files and other non-email strings containing @ symbol
-    if any(ext in email for ext in [".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".ico"]):
-        return None
-    
-    # Remove any invalid start/end characters
-    email = re.sub(r'^[^a-zA-Z0-9]+|[^a-zA-Z0-9\.]+$', '', email)
-    
-    # Check if the email follows a valid pattern
-    if re.match(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', email):
-        # Ensure the email doesn't contain file extensions or other non-email patterns
-        parts = email.split('@')
-        if len(parts) == 2 and "." in parts[1]:
-            domain_part = parts[1]
-            # Check if the domain part looks valid (not an image or file name)
-            if not re.search(r'\d+x\d+', domain_part):  # Pattern often found in image dimensions
-                return email
-    return None
-
-# Extract domain from URL
-def get_domain(url):
-    try:
-        extracted = tldextract.extract(url)
-        return f"{extracted.domain}.{extracted.suffix}"
-    except:
-        return None
-
-# Function to clean and deduplicate emails
-def clean_and_deduplicate_emails(emails_list):
-    if not emails_list:
-        return []
-    
-    # First round of cleaning and deduplication
-    clean_emails = set()
-    for email in emails_list:
-        valid_email = validate_email(email)
-        if valid_email:
-            # Skip emails from the ignore domains
-            if not any(ignore_domain in valid_email for ignore_domain in IGNORE_DOMAINS):
-                clean_emails.add(valid_email)
-    
-    # Handle cases where one email is contained within another
-    # (like "501-3362hello@snovistudios.com" vs "hello@snovistudios.com")
-    emails_to_remove = set()
-    final_emails = list(clean_emails)
-    
-    for i in range(len(final_emails)):
-        for j in range(len(final_emails)):
-            if i != j and final_emails[i] != final_emails[j]:
-                # Split emails into username and domain parts
-                email1_parts = final_emails[i].split('@')
-                email2_parts = final_emails[j].split('@')
-                
-                # Check if they have the same domain
-                if len(email1_parts) == 2 and len(email2_parts) == 2 and email1_parts[1] == email2_parts[1]:
-                    username1 = email1_parts[0]
-                    username2 = email2_parts[0]
-                    
-                    # If one username is contained within the other
-                    if username1 in username2:
-                        # Keep the shorter one (assuming it's cleaner)
-                        emails_to_remove.add(final_emails[j])
-                    elif username2 in username1:
-                        emails_to_remove.add(final_emails[i])
-                    # Special case for project.info@ vs info@
-                    elif '.' in username1 and username1.split('.')[-1] == username2:
-                        emails_to_remove.add(final_emails[i])
-                    elif '.' in username2 and username2.split('.')[-1] == username1:
-                        emails_to_remove.add(final_emails[j])
-    
-    # Remove emails flagged for removal
-    final_cleaned = [email for email in final_emails if email not in emails_to_remove]
-    
-    return final_cleaned
-
-# Function to extract emails from a website using multiple methods
-def extract_emails(base_url):
-    emails_set = set()  # Use set to store unique emails (case insensitive)
-    domain = get_domain(base_url)
-    
-    # Function to process a single URL and extract emails
-    def process_url(url, is_contact_page=False):
-        local_emails = set()
-        try:
-            headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"}
-            response = requests.get(url, headers=headers, timeout=15)
-            html_content = response.text
-            soup = BeautifulSoup(html_content, "html.parser")
-            
-            # Method 1: Extract emails from visible text
-            text_content = soup.get_text(separator=" ")
-            text_emails = re.findall(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}", text_content)
-            
-            # Method 2: Extract emails from mailto links - improved
-            # Find all a tags and look deeply through attributes
-            all_a_tags = soup.find_all("a")
-            mailto_emails = []
-            for a_tag in all_a_tags:
-                # Check href attribute
-                href = a_tag.get("href", "")
-                if "mailto:" in href:
-                    email = href.replace("mailto:", "").split("?")[0].strip()
-                    email = unquote(email)  # Handle URL encoded characters
-                    mailto_emails.append(email)
-                
-                # Also check other attributes and text for emails
-                for attr_name, attr_value in a_tag.attrs.items():
-                    if isinstance(attr_value, str) and "@" in attr_value:
-                        potential_emails = re.findall(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}", attr_value)
-                        mailto_emails.extend(potential_emails)
-            
-            # Method 3: Check for elements with email-related classes or IDs
-            email_classes = ["email", "mail", "e-mail", "contact", "email-address", "mail-link", "mini-contacts", 
-                             "footer-contact", "header-contact", "contact-info", "contact-details", "contact-email",
-                             "footer-email", "header-email", "info"]
-            class_emails = []
-            for class_name in email_classes:
-                elements = soup.find_all(class_=re.compile(class_name, re.I))
-                for element in elements:
-                    # Extract email from text content
-                    element_text = element.get_text()
-                    found_emails = re.findall(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}", element_text)
-                    class_emails.extend(found_emails)
-                    
-                    # Also check attributes
-                    for attr_name, attr_value in element.attrs.items():
-                        if isinstance(attr_value, str) and "@" in attr_value:
-                            potential_emails = re.findall(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}", attr_value)
-                            class_emails.extend(potential_emails)
-            
-            # Method 4: Extract from all tags and attributes (comprehensive scan)
-            all_tags_emails = []
-            for tag in soup.find_all():
-                # Check tag content
-                if tag.string and "@" in tag.string:
-                    found_emails = re.findall(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}", tag.string)
-                    all_tags_emails.extend(found_emails)
-                
-                # Check all attributes
-                for attr_name, attr_value in tag.attrs.items():
-                    if isinstance(attr_value, str) and "@" in attr_value:
-                        found_emails = re.findall(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}", attr_value)
-                        all_tags_emails.extend(found_emails)
-            
-            # Method 5: Extract from script tags more thoroughly
-            script_emails = []
-            script_tags = soup.find_all("script")
-            for script in script_tags:
-                if script.string:
-                    # Look for explicit email field in JSON
-                    email_patterns = [
-                        r'"email"\s*:\s*"([^"]+@[^"]+\.[^"]+)"',       # "email": "example@domain.com"
-                        r'"emailAddress"\s*:\s*"([^"]+@[^"]+\.[^"]+)"', # "emailAddress": "example@domain.com"
-                        r'"mail"\s*:\s*"([^"]+@[^"]+\.[^"]+)"',         # "mail": "example@domain.com"
-                        r'"e-mail"\s*:\s*"([^"]+@[^"]+\.[^"]+)"',       # "e-mail": "example@domain.com"
-                        r'"contactEmail"\s*:\s*"([^"]+@[^"]+\.[^"]+)"', # "contactEmail": "example@domain.com"
-                        r'"support_email"\s*:\s*"([^"]+@[^"]+\.[^"]+)"' # "support_email": "example@domain.com"
-                    ]
-                    
-                    for pattern in email_patterns:
-                        found_emails = re.findall(pattern, script.string)
-                        script_emails.extend(found_emails)
-                    
-                    # Also extract general email pattern
-                    general_emails = re.findall(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}", script.string)
-                    script_emails.extend(general_emails)
-                    
-                    # Try to parse JSON data
-                    try:
-                        # Extract any JSON-like structures from the script
-                        json_matches = re.findall(r'\{[^{}]*\}', script.string)
-                        for json_str in json_matches:
-                            try:
-                                data = json.loads(json_str)
-                                # Recursively search for email keys in the JSON
-                                def extract_json_emails(obj):
-                                    found = []
-                                    if isinstance(obj, dict):
-                                        for key, value in obj.items():
-                                            if isinstance(value, str) and any(k in key.lower() for k in ['email', 'mail', 'contact']):
-                                                if '@' in value and '.' in value:
-                                                    found.append(value)
-                                            elif isinstance(value, (dict, list)):
-                                                found.extend(extract_json_emails(value))
-                                    elif isinstance(obj, list):
-                                        for item in obj:
-                                            found.extend(extract_json_emails(item))
-                                    return found
-                                
-                                json_emails = extract_json_emails(data)
-                                script_emails.extend(json_emails)
-                            except:
-                                pass
-                    except:
-                        pass
-            
-            # Method 6: Extract from meta tags
-            meta_emails = []
-            meta_tags = soup.find_all("meta")
-            for meta in meta_tags:
-                content = meta.get("content", "")
-                if "@" in content:
-                    found_emails = re.findall(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}", content)
-                    meta_emails.extend(found_emails)
-            
-            # Method 7: Look specifically for common email domains in the entire HTML content
-            domain_based_emails = []
-            for email_domain in COMMON_EMAIL_DOMAINS:
-                # Find all text containing common email domains
-                domain_pattern = r'[a-zA-Z0-9._%+-]+@' + re.escape(email_domain)
-                found_domain_emails = re.findall(domain_pattern, html_content)
-                domain_based_emails.extend(found_domain_emails)
-            
-            # Method 8: Look for obfuscated emails (especially on contact pages)
-            if is_contact_page:
-                # Look for JavaScript email obfuscation
-                for script in script_tags:
-                    if script.string and any(term in script.string.lower() for term in ['email', 'mail', 'contact']):
-                        # Check for string concatenation
-                        concat_patterns = [
-                            r'[\'"]\s*\+\s*[\'"]',  # "+" patterns like 'user' + '@' + 'domain.com'
-                            r'\.join\(',            # Array.join() method
-                            r'\.reverse\(',         # String or array reverse()
-                            r'String\.fromCharCode' # Character code conversion
-                        ]
-                        
-                        if any(re.search(pattern, script.string) for pattern in concat_patterns):
-                            # Extract anything that looks like it could be part of email when concatenated
-                            parts = re.findall(r'[\'"]([a-zA-Z0-9._%+-@]+)[\'"]', script.string)
-                            if parts and '@' in ''.join(parts):
-                                # Try simple reconstruction for common patterns
-                                reconstructed = ''.join(parts)
-                                potential_emails = re.findall(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}", reconstructed)
-                                if potential_emails:
-                                    domain_based_emails.extend(potential_emails)
-                
-                # Look for emails in contact form HTML structure
-                contact_forms = soup.find_all('form')
-                for form in contact_forms:
-                    # Check for hidden email fields
-                    hidden_fields = form.find_all('input', {'type': 'hidden'})
-                    for field in hidden_fields:
-                        value = field.get('value', '')
-                        if '@' in value:
-                            found_emails = re.findall(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}", value)
-                            domain_based_emails.extend(found_emails)
-            
-            # Combine all emails
-            all_extracted_emails = (text_emails + mailto_emails + class_emails + 
-                                   all_tags_emails + script_emails + meta_emails + 
-                                   domain_based_emails)
-            
-            # Clean and add valid emails to the local set
-            for email in all_extracted_emails:
-                valid_email = validate_email(email)
-                if valid_email:
-                    # Skip emails from the ignore domains
-                    if not any(ignore_domain in valid_email for ignore_domain in IGNORE_DOMAINS):
-                        local_emails.add(valid_email)
-        
-        except Exception as e:
-            pass
-        
-        return local_emails
-    
-    # First process the main URL
-    main_page_emails = process_url(base_url)
-    emails_set.update(main_page_emails)
-    
-    # Then process contact pages regardless of how many emails we found
-    # (to ensure we get the most accurate contact emails)
-    for contact_path in CONTACT_PAGES:
-        contact_url = urljoin(base_url, contact_path)
-        if contact_url != base_url:  # Avoid processing the same URL twice
-            try:
-                contact_page_emails = process_url(contact_url, is_contact_page=True)
-                emails_set.update(contact_page_emails)
-            except:
-                continue
-    
-    # Clean and deduplicate emails
-    all_emails = clean_and_deduplicate_emails(list(emails_set))
-    
-    # Prioritize emails with domain matching the website
-    domain_emails = [email for email in all_emails if domain and domain in email]
-    other_emails = [email for email in all_emails if email not in domain_emails]
-    
-    # Sort emails with domain emails first
-    sorted_emails = sorted(domain_emails) + sorted(other_emails)
-    
-    return sorted_emails  # Return as a list instead of a comma-separated string
+# pandas and the crawl cache are imported in the functions that use them, so the page renders
+# before they have loaded; the crawler itself only runs in the worker processes
 
 # Function to process Google Sheets
 def process_google_sheet(sheet_url):
+    import pandas as pd
     try:
-        sheet_id = sheet_url.split('/d/')[1].split('/')[0]
-        csv_url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq?tqx=out:csv"
-        df = pd.read_csv(csv_url)
+        df = pd.read_csv(google_sheet_csv_url(sheet_url))
         return df
     except:
         return None
@@ -332,111 +27,217 @@ if sheet_url:
     if df is not None:
         column = st.selectbox("Select column containing website links:", df.columns)
 
-        if st.button("Find Emails"):
-            all_results = []
-            total = len(df[column])
-            progress_bar = st.progress(0)
-            start_time = time.time()
-            extracted_count = 0
-            status_text = st.empty()
-
-            for i, website in enumerate(df[column], start=1):
-                if website and isinstance(website, str):  # Skip empty URLs
-                    # Ensure URL has proper http:// prefix
-                    if not website.startswith(('http://', 'https://')):
-                        website = 'https://' + website
-                        
-                    emails = extract_emails(website)
-                    extracted_count += len(emails)
-                    
-                    # Create a row for each email
-                    if emails:
-                        for email in emails:
-                            all_results.append({"Website": website, "Email": email})
-                    else:
-                        all_results.append({"Website": website, "Email": ""})
-
-                    # Update progress
-                    progress_bar.progress(i / total)
+        with st.expander("Crawl settings"):
+            max_concurrency = st.number_input("Concurrent requests", min_value=1, max_value=200, value=MAX_CONCURRENCY)
+            per_host_limit = st.number_input("Concurrent requests per host", min_value=1, max_value=20, value=PER_HOST_LIMIT)
+            request_timeout = st.number_input("Request timeout (seconds)", min_value=1, max_value=120, value=REQUEST_TIMEOUT,
+                                              help="Upper bound; hosts that answer quickly get a shorter timeout")
+            site_budget = st.number_input("Time budget per site (seconds, 0 for none)", min_value=0, max_value=600,
+                                          value=SITE_TIME_BUDGET)
+            parse_workers = st.number_input("Parser processes per worker (0 parses in the worker process)",
+                                            min_value=0, max_value=64, value=PARSE_WORKERS)
+            unit_size = st.number_input("Rows per work unit", min_value=1, max_value=10000, value=JOB_UNIT_SIZE,
+                                        help="Workers lease this many rows at a time; smaller units spread a sheet "
+                                             "over more workers")
+            start_local_worker = st.checkbox("Start a local worker if none is running", value=True,
+                                             help="Otherwise run `python -m fs_em.worker` on this or other machines")
+            use_http2 = st.checkbox("Use HTTP/2 where supported", value=HTTP2_AVAILABLE, disabled=not HTTP2_AVAILABLE)
+            use_cache = st.checkbox("Use crawl cache", value=True,
+                                    help="Reuse pages and results from earlier runs; stale pages are revalidated")
+            refresh_cache = st.checkbox("Refresh cache (ignore cached pages and results)", value=False)
+            if st.button("Purge cache"):
+                from fs_em.cache import CrawlCache
+                cache = CrawlCache()
+                cache.purge()
+                cache.close()
+                st.success("Crawl cache purged")
 
-                    # Time calculations
-                    elapsed_time = time.time() - start_time
-                    estimated_total_time = (elapsed_time / i) * total
-                    remaining_time = max(0, estimated_total_time - elapsed_time)
-
-                    status_text.text(f"Progress: {i}/{total} | Emails Extracted: {extracted_count} | "
-                                    f"Estimated time remaining: {int(remaining_time // 60)} min {int(remaining_time % 60)} sec")
-                    time.sleep(0.1)
-
-            # Convert results to DataFrame
-            result_df = pd.DataFrame(all_results)
-
-            # Display an easily copyable table with more compact styling
-            st.markdown("### Extracted Emails Table")
-
-            # Calculate the height based on the number of rows
-            row_height = 30  # Height per row in pixels
-            max_rows_visible = 10  # Maximum rows visible without scrolling
-            header_height = 40  # Height of the header row in pixels
-
-            # Set the container height to fit up to 10 rows
-            if len(result_df) <= max_rows_visible:
-                table_height = header_height + (len(result_df) * row_height)  # Exact height for all rows
-            else:
-                table_height = header_height + (max_rows_visible * row_height)  # Fixed height for 10 rows
-
-            # Create a scrollable container with dynamic height
-            st.markdown(f"""
-                <div style="height: {table_height}px; overflow-y: auto; border: 1px solid #e6e6e6; border-radius: 5px;">
-                    {result_df.to_html(index=False, escape=False, classes="compact-table")}
-                </div>
-            """, unsafe_allow_html=True)
-
-            # Convert DF for download
-            def convert_df(df):
-                return df.to_csv(index=False).encode('utf-8')
-
-            csv = convert_df(result_df)
-            st.download_button("Download CSV", csv, "emails.csv", "text/csv")
+        if st.button("Find Emails"):
+            # Skip empty URLs and ensure the rest have a proper http:// prefix
+            websites = [website for website in map(normalize_website, df[column]) if website]
+
+            # The sheet is queued as a job for the workers, so reruns and refreshes don't lose it
+            settings = {"max_concurrency": max_concurrency, "per_host_limit": per_host_limit, "timeout": request_timeout,
+                        "site_budget": site_budget, "parse_workers": parse_workers, "http2": use_http2, "use_cache": use_cache,
+                        "refresh_cache": refresh_cache}
+            journal = open_journal()
+            job_id = journal.create_job(websites, settings, source=sheet_url, unit_size=unit_size)
+            if start_local_worker and not journal.live_workers():
+                spawn_worker()
+            journal.close()
+            st.query_params["job"] = job_id
     else:
         st.error("Invalid Google Sheet URL")
 
-# Improved CSS for more compact table
-st.markdown("""
-    <style>
-        .compact-table {
-            font-size: 12px;
-            width: 100%;
-            table-layout: fixed;
-            margin: 0;
-            border-collapse: collapse;
-        }
-        .compact-table th, .compact-table td {
-            padding: 4px 8px;
-            overflow: hidden;
-            text-overflow: ellipsis;
-            white-space: nowrap;
-            border: 1px solid #ddd;
-            color: #000000; /* Black text color */
-        }
-        .compact-table th:first-child, .compact-table td:first-child {
-            width: 40%;
-        }
-        .compact-table th:last-child, .compact-table td:last-child {
-            width: 60%;
-        }
-        .compact-table tr:nth-child(even) {
-            background-color: #f5f5f5;
-        }
-        .compact-table tr:nth-child(odd) {
-            background-color: #f0f0f0; 
-        }
-        .compact-table th {
-            background-color: #f0f0f0;
-            position: sticky;
-            top: 0;
-            z-index: 1;
-            color: #000000; 
-        }
-    </style>
-""", unsafe_allow_html=True)
\ No newline at end of file
+# Function to turn (website, emails) results into a DataFrame with a row for each email
+def results_to_df(results):
+    import pandas as pd
+    all_results = []
+    for website, emails in results:
+        if emails:
+            for email in emails:
+                all_results.append({"Website": website, "Email": email})
+        else:
+            all_results.append({"Website": website, "Email": ""})
+    return pd.DataFrame(all_results, columns=["Website", "Email"])
+
+# Function to show a job's finished sites a page at a time, so only one page is read from the
+# journal and sent to the browser on each run
+def render_results(journal, job_id, done):
+    st.markdown("### Extracted Emails Table")
+    pages = max(1, -(-done // RESULTS_PAGE_SIZE))
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key=f"results-page-{job_id}")
+    offset = (min(page, pages) - 1) * RESULTS_PAGE_SIZE
+    result_df = results_to_df(journal.job_results_page(job_id, offset, RESULTS_PAGE_SIZE))
+    # st.dataframe renders a virtualized grid, so long pages scroll without building HTML for every row
+    st.dataframe(result_df, hide_index=True, height=min(400, 40 + 35 * len(result_df)))
+    st.caption(f"Sites {offset + 1 if done else 0}-{min(offset + RESULTS_PAGE_SIZE, done)} of {done} finished")
+
+# Function to make a download button's data callable: it writes a job export to disk from the
+# journal when the button is clicked (and only if sites finished since the last export), instead
+# of building it in memory on every run
+def job_export(job_id, method, *args):
+    def export():
+        journal = open_journal()
+        try:
+            path = getattr(journal, method)(job_id, *args)
+        finally:
+            journal.close()
+        with open(path, "rb") as f:
+            return f.read()
+    return export
+
+# Function to offer a job's results as a CSV download
+def render_results_download(job_id, label="Download CSV", file_name="emails.csv"):
+    st.download_button(label, job_export(job_id, "export_job_csv"), file_name, "text/csv")
+
+# Function to show a job's progress line
+def render_job_progress(job):
+    total = job["total"]
+    done = job["done"]
+    st.progress(done / total if total else 1.0)
+
+    # Time calculations, based on the rate since the job was last (re)started
+    status = f"Progress: {done}/{total} | Emails Extracted: {job['emails']}"
+    done_this_run = done - (job["done_at_start"] or 0)
+    if job["status"] == "running" and done_this_run > 0:
+        elapsed_time = time.time() - job["started_at"]
+        remaining_time = elapsed_time / done_this_run * (total - done)
+        status += f" | Estimated time remaining: {int(remaining_time // 60)} min {int(remaining_time % 60)} sec"
+    st.text(status)
+
+    stats = job["stats"]
+    if stats:
+        st.caption(f"Requests: {stats['requests']} | Connections opened: {stats['connections_opened']} | "
+                   f"Pool hits: {stats['pool_hits']} ({stats['reuse_ratio']:.0%} reused) | "
+                   f"DNS lookups: {stats['dns_lookups']} (cache hits: {stats['dns_cache_hits']}) | "
+                   f"HTTP/2 responses: {stats['http2_responses']}")
+        if "result_hits" in stats:
+            st.caption(f"Cached results reused: {stats['result_hits']} | Cached pages reused: "
+                       f"{stats['page_hits']} | Revalidated (304): {stats['page_revalidated']}")
+        if stats.get("timing", {}).get("duplicates"):
+            st.caption(f"Rows sharing a domain already crawled: {stats['timing']['duplicates']} | "
+                       f"Fetches saved: {stats['timing']['fetches_saved']}")
+        if stats.get("timing", {}).get("sites"):
+            render_timing_breakdown(stats["timing"])
+
+# Function to show where a job's time went and what failed, summed over its sites
+def render_timing_breakdown(timing):
+    import pandas as pd
+    with st.expander("Time breakdown"):
+        total = sum(timing["timings"].values()) or 1.0
+        phases = pd.DataFrame([{"Phase": phase, "Seconds": round(seconds, 2), "Share": f"{seconds / total:.1%}"}
+                               for phase, seconds in timing["timings"].items()])
+        st.dataframe(phases, hide_index=True)
+        if timing["failures"]:
+            st.caption("Failed requests: " + " | ".join(f"{kind}: {count}" for kind, count in timing["failures"].items()))
+        if timing["site_errors"]:
+            st.caption("Sites that failed: " + " | ".join(f"{kind}: {count}"
+                                                         for kind, count in timing["site_errors"].items()))
+        if timing["slowest"]:
+            st.caption("Slowest sites: " + " | ".join(f"{website} ({seconds:.1f}s)"
+                                                     for website, seconds in timing["slowest"]))
+
+# Function to offer a job's per-site timing and failures as CSV and JSON downloads
+def render_metrics_downloads(job_id):
+    st.download_button("Download timing CSV", job_export(job_id, "export_job_metrics", "csv"), "emails_timing.csv",
+                       "text/csv")
+    st.download_button("Download timing JSON", job_export(job_id, "export_job_metrics", "json"),
+                       "emails_timing.json", "application/json")
+
+# Function to show the workers that crawled a job, with each one's recent throughput, and to
+# offer starting a local worker when a queued job has none
+def render_workers(journal, job):
+    import pandas as pd
+    live_workers = journal.live_workers()
+    throughput = journal.job_worker_throughput(job["id"])
+    if throughput:
+        rows = [{"Worker": row["worker"], "Host": row["host"], "PID": row["pid"],
+                 "State": f"unit {row['unit']}" if row["unit"] is not None else "idle" if row["alive"] else "stopped",
+                 "Sites": row["sites"], "Emails": row["emails"], "Sites/sec": round(row["sites_per_sec"], 2)}
+                for row in throughput]
+        st.dataframe(pd.DataFrame(rows), hide_index=True)
+    st.caption(f"Work units: {job['units_done']}/{job['units']} done, {job['units_leased']} leased | "
+               f"Workers running: {len(live_workers)} | Throughput: "
+               f"{sum(row['sites_per_sec'] for row in throughput):.1f} sites/sec over the last {THROUGHPUT_WINDOW}s")
+    if job["status"] in ("queued", "running") and not live_workers:
+        st.warning("No workers are running. Start one here or run `python -m fs_em.worker`.")
+        if st.button("Start a local worker"):
+            spawn_worker()
+
+# Live view of a queued or running job; reruns on its own until the job stops
+@st.fragment(run_every=JOB_REFRESH_INTERVAL)
+def render_running_job(job_id):
+    journal = open_journal()
+    try:
+        job = journal.get_job(job_id)
+        if job["status"] not in ("queued", "running"):
+            st.rerun()
+        render_job_progress(job)
+        render_workers(journal, job)
+        if st.button("Cancel job"):
+            journal.cancel_job(job_id)
+            st.rerun()
+        if job["done"]:
+            render_results_download(job_id, "Download partial CSV", "emails_partial.csv")
+            render_results(journal, job_id, job["done"])
+    finally:
+        journal.close()
+
+# Attach to the job in the URL, so a refresh or a new tab picks the run back up
+job_id = st.query_params.get("job")
+if job_id:
+    journal = open_journal()
+    job = journal.get_job(job_id)
+    if job is None:
+        st.error("Job not found")
+    elif job["status"] in ("queued", "running"):
+        render_running_job(job_id)
+    else:
+        st.markdown(f"**Job {job_id}: {job['status']}**")
+        if job["error"]:
+            st.error(job["error"])
+        render_job_progress(job)
+        if job["units"]:
+            render_workers(journal, job)
+        if job["status"] != "done" and st.button("Resume job"):
+            start_job(job_id)
+            if not journal.live_workers():
+                spawn_worker()
+            st.rerun()
+        if job["done"]:
+            render_results_download(job_id, label="Download CSV" if job["status"] == "done" else "Download partial CSV")
+            render_results(journal, job_id, job["done"])
+            render_metrics_downloads(job_id)
+    journal.close()
+
+# Recent jobs, to reattach to after closing the tab
+journal = open_journal()
+recent_jobs = journal.list_jobs()
+journal.close()
+if recent_jobs:
+    st.sidebar.markdown("### Recent jobs")
+    for recent in recent_jobs:
+        if st.sidebar.button(f"{recent['status']} · {recent['done']}/{recent['total']} · {recent['id']}", key=recent["id"]):
+            st.query_params["job"] = recent["id"]
+            st.rerun()
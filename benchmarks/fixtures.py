@@ -0,0 +1,181 @@
+import time
+import json
+import random
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# How each generated site behaves, with how often it occurs
+SITE_KINDS = {"normal": 60, "soft404": 15, "slow": 10, "redirect": 10, "large": 2, "hanging": 3}
+# Where a site links its contact page from ("none" leaves the crawler to the static CONTACT_PAGES)
+DISCOVERY = ["nav", "footer", "sitemap", "none"]
+# Contact paths used by generated sites; all are in CONTACT_PAGES so "none" still finds them
+CONTACT_PATHS = ["/contact", "/contact-us", "/about", "/get-in-touch", "/team"]
+# Usernames for planted emails; none contains another, so deduplication keeps them all
+USERNAMES = ["hello", "sales", "support", "office", "press", "careers", "billing", "partners"]
+HOMEPAGE_PLACEMENTS = ["mailto", "jsonld", "meta", "text"]
+CONTACT_PLACEMENTS = ["mailto", "obfuscated", "text", "split"]
+
+SLOW_DELAY = (0.2, 1.0)  # Seconds added to every response from a slow site
+HANG_SECONDS = 120  # A hanging site holds the connection this long without answering
+LARGE_PAGE_BYTES = (1024 * 1024, 3 * 1024 * 1024)  # Filler size of a large homepage
+
+# Function to name the n-th generated site
+def site_host(index):
+    return f"site-{index:05d}.com"
+
+# Function to describe a generated site: its kind, pages and the emails planted on them.
+# The same seed and index always give the same site.
+@lru_cache(maxsize=4096)
+def site_spec(index, seed=0):
+    rng = random.Random(f"{seed}-{index}")
+    host = site_host(index)
+    kind = rng.choices(list(SITE_KINDS), weights=list(SITE_KINDS.values()))[0]
+    usernames = rng.sample(USERNAMES, 4)
+    homepage_emails = {placement: f"{usernames[i]}@{host}"
+                       for i, placement in enumerate(rng.sample(HOMEPAGE_PLACEMENTS, rng.randint(1, 2)))}
+    contact_emails = {placement: f"{usernames[2 + i]}@{host}"
+                      for i, placement in enumerate(rng.sample(CONTACT_PLACEMENTS, rng.randint(1, 2)))}
+    if rng.random() < 0.3:
+        homepage_emails["freemail"] = f"site{index}owner@gmail.com"
+    return {
+        "index": index,
+        "host": host,
+        "kind": kind,
+        "discovery": rng.choice(DISCOVERY),
+        "contact_path": rng.choice(CONTACT_PATHS),
+        "homepage_emails": homepage_emails,
+        "contact_emails": contact_emails,
+        "delay": rng.uniform(*SLOW_DELAY) if kind == "slow" else 0,
+        "filler": rng.randint(*LARGE_PAGE_BYTES) if kind == "large" else 0,
+    }
+
+# Function to list the emails the crawler should find for a site
+def expected_emails(spec):
+    if spec["kind"] == "hanging":
+        return set()
+    return set(spec["homepage_emails"].values()) | set(spec["contact_emails"].values())
+
+# Function to render one planted email in the requested way
+def render_email(placement, email):
+    if placement == "mailto":
+        return f'<a href="mailto:{email}?subject=Hi">Email us</a>'
+    if placement == "jsonld":
+        data = {"@context": "https://schema.org", "@type": "Organization", "email": email}
+        return f'<script type="application/ld+json">{json.dumps(data)}</script>'
+    if placement == "meta":
+        return f'<meta name="description" content="Reach us at {email} any time">'
+    if placement == "obfuscated":
+        user, domain = email.split("@")
+        return f"<script>// contact mail\nvar e = '{user}' + '@' + '{domain}'; document.write(e);</script>"
+    if placement == "split":
+        user, domain = email.split("@")
+        return f'<span class="contact-email">{user}@<b>{domain}</b></span>'
+    return f"<p>Write to {email} and we will get back to you.</p>"
+
+def render_homepage(spec):
+    contact_link = f'<a href="{spec["contact_path"]}">Contact us</a>'
+    nav = contact_link if spec["discovery"] == "nav" else '<a href="/services">Services</a>'
+    footer = contact_link if spec["discovery"] == "footer" else "<span>All rights reserved</span>"
+    emails = "".join(render_email(placement, email) for placement, email in spec["homepage_emails"].items())
+    meta = "".join(render_email(p, e) for p, e in spec["homepage_emails"].items() if p == "meta")
+    body_emails = emails.replace(meta, "") if meta else emails
+    filler = ""
+    if spec["filler"]:
+        paragraph = "<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor.</p>\n"
+        filler = paragraph * (spec["filler"] // len(paragraph))
+    return (f'<!DOCTYPE html><html><head><title>{spec["host"]}</title>{meta}</head><body>'
+            f'<header><nav><a href="/">Home</a> {nav}</nav></header>'
+            f'<main><h1>Welcome to {spec["host"]}</h1>{filler}{body_emails}</main>'
+            f'<footer>{footer}</footer></body></html>')
+
+def render_contact_page(spec):
+    emails = "".join(render_email(placement, email) for placement, email in spec["contact_emails"].items())
+    return (f'<!DOCTYPE html><html><head><title>Contact</title></head><body>'
+            f'<nav><a href="/">Home</a></nav><main><h1>Contact</h1>{emails}</main></body></html>')
+
+@lru_cache(maxsize=256)
+def page_body(index, seed, page):
+    spec = site_spec(index, seed)
+    html = render_homepage(spec) if page == "home" else render_contact_page(spec)
+    return html.encode()
+
+def render_sitemap(spec, base_url):
+    locs = [f"{base_url}/"]
+    if spec["discovery"] == "sitemap":
+        locs.append(f"{base_url}{spec['contact_path']}")
+    urls = "".join(f"<url><loc>{loc}</loc></url>" for loc in locs)
+    return f'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'.encode()
+
+# Serves every generated site, picking the site from the Host header
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    seed = 0
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, status, body, content_type="text/html; charset=utf-8", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def redirect(self, location, status=301):
+        self.send_body(status, b"", headers={"Location": location})
+
+    def do_GET(self):
+        host = self.headers.get("Host", "").split(":")[0]
+        try:
+            index = int(host.replace("www.", "").split(".")[0].split("-")[1])
+        except (IndexError, ValueError):
+            return self.send_body(404, b"unknown site")
+        spec = site_spec(index, self.seed)
+        path = self.path.split("?")[0].split("#")[0]
+
+        if spec["kind"] == "hanging":
+            time.sleep(HANG_SECONDS)
+            return
+        if spec["delay"]:
+            time.sleep(spec["delay"])
+
+        if spec["kind"] == "redirect":
+            # Bare domain -> www, then / -> /home -> /index.html
+            if not host.startswith("www."):
+                return self.redirect(f"http://www.{host}:{self.server.server_port}{self.path}")
+            if path == "/":
+                return self.redirect("/home")
+            if path == "/home":
+                return self.redirect("/index.html", 302)
+            if path == "/index.html":
+                path = "/"
+
+        if path == "/":
+            return self.send_body(200, page_body(index, self.seed, "home"))
+        if path.rstrip("/") == spec["contact_path"]:
+            return self.send_body(200, page_body(index, self.seed, "contact"))
+        if path == "/sitemap.xml":
+            return self.send_body(200, render_sitemap(spec, f"http://{self.headers['Host']}"), "application/xml")
+        if spec["kind"] == "soft404":
+            # Unknown paths get the homepage again with a 200
+            return self.send_body(200, page_body(index, self.seed, "home"))
+        return self.send_body(404, b"<html><body><h1>Not found</h1></body></html>")
+
+# Function to start the fixture server on a background thread; returns the server
+def start_fixture_server(port=0, seed=0):
+    handler = type("SeededFixtureHandler", (FixtureHandler,), {"seed": seed})
+    # The default listen backlog of 5 would make connects, not the crawler, the bottleneck
+    server_class = type("FixtureServer", (ThreadingHTTPServer,), {"request_queue_size": 1024})
+    server = server_class(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fixture-server", daemon=True).start()
+    return server
+
+# Function to run the fixture server in its own process, reporting the bound port through a queue
+def serve_fixtures(port_queue, seed=0):
+    server = start_fixture_server(seed=seed)
+    port_queue.put(server.server_port)
+    threading.Event().wait()
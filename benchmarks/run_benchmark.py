@@ -0,0 +1,172 @@
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from fs_em.config import PARSE_WORKERS, PER_HOST_LIMIT
+from fs_em.crawler import CrawlEngine
+from benchmarks.fixtures import site_host, site_spec, expected_emails, serve_fixtures
+
+DEFAULT_SIZES = "100,1000,10000"  # Sheet sizes (rows) to benchmark
+BENCH_CONCURRENCY = 50  # Requests in flight; every host is local so this can be higher than the app default
+BENCH_TIMEOUT = 3  # Seconds per request; bounds how long hanging hosts hold a slot
+MISMATCH_EXAMPLES = 5  # Mismatching sites printed per run
+
+# Crawl engine that records how long each site takes from start to finished result
+class TimedEngine(CrawlEngine):
+    def __init__(self, **engine_options):
+        super().__init__(**engine_options)
+        self.latencies = []
+
+    async def extract_emails(self, base_url, site=None):
+        start = time.perf_counter()
+        try:
+            return await super().extract_emails(base_url, site)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run_benchmark",
+                                     description="Benchmark the crawler against generated local websites.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"comma-separated sheet sizes (default: {DEFAULT_SIZES})")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the generated sites (default: 0)")
+    parser.add_argument("--concurrency", type=int, default=BENCH_CONCURRENCY,
+                        help=f"requests in flight across all sites (default: {BENCH_CONCURRENCY})")
+    parser.add_argument("--per-host", type=int, default=PER_HOST_LIMIT,
+                        help=f"requests in flight against any single host (default: {PER_HOST_LIMIT})")
+    parser.add_argument("--timeout", type=float, default=BENCH_TIMEOUT,
+                        help=f"seconds per request (default: {BENCH_TIMEOUT})")
+    parser.add_argument("--parse-workers", type=int, default=PARSE_WORKERS,
+                        help=f"parser processes; 0 parses on threads (default: {PARSE_WORKERS})")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the extracted emails to PATH")
+    parser.add_argument("--check-baseline", metavar="PATH",
+                        help="fail if any site's emails differ from a baseline saved with --save-baseline")
+    parser.add_argument("--json", metavar="PATH", help="also write the metrics to PATH as JSON")
+    return parser.parse_args(argv)
+
+# Function to get the p-th percentile (0-100) of a list of numbers, nearest-rank
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+# Function to crawl the first `size` generated sites and measure the run.
+# Runs in a fresh process so peak RSS and child CPU time belong to this size alone.
+def run_size(size, port, seed, engine_options):
+    websites = [f"http://{site_host(index)}:{port}" for index in range(size)]
+    resolve = {}
+    for index in range(size):
+        resolve[site_host(index)] = "127.0.0.1"
+        resolve["www." + site_host(index)] = "127.0.0.1"
+    engine = TimedEngine(transport_options={"resolve": resolve}, **engine_options)
+    results = {}
+
+    async def crawl():
+        async with engine:
+            async for index, website, emails in engine.crawl_iter(websites):
+                results[site_host(index)] = emails
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    asyncio.run(crawl())
+    wall = time.perf_counter() - wall_start
+    # Parser processes are reaped when the engine closes, so their CPU time is in RUSAGE_CHILDREN
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = time.process_time() - cpu_start + children.ru_utime + children.ru_stime
+    pages = engine.transport_stats().get("requests", 0)
+
+    mismatches = []
+    for index in range(size):
+        host = site_host(index)
+        spec = site_spec(index, seed)
+        found = set(results.get(host) or [])
+        if found != expected_emails(spec):
+            mismatches.append({"site": host, "kind": spec["kind"], "discovery": spec["discovery"],
+                               "missing": sorted(expected_emails(spec) - found),
+                               "unexpected": sorted(found - expected_emails(spec))})
+    return {
+        "size": size,
+        "seconds": wall,
+        "sites_per_sec": size / wall if wall else 0.0,
+        "p50": percentile(engine.latencies, 50),
+        "p95": percentile(engine.latencies, 95),
+        "p99": percentile(engine.latencies, 99),
+        "pages": pages,
+        "cpu_ms_per_page": cpu * 1000 / pages if pages else 0.0,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_worker_rss_mb": children.ru_maxrss / 1024,
+        "breakdown": engine.metrics_summary(),
+        "mismatches": mismatches,
+        "results": results,
+    }
+
+# Function to compare a run's emails with a saved baseline; returns the sites that changed
+def compare_baseline(results, baseline):
+    changed = []
+    for host, emails in results.items():
+        if host in baseline and sorted(baseline[host]) != sorted(emails or []):
+            changed.append({"site": host, "baseline": sorted(baseline[host]), "now": sorted(emails or [])})
+    return changed
+
+def print_report(run):
+    print(f"{run['size']:>6} sites  {run['seconds']:8.1f}s  {run['sites_per_sec']:8.1f} sites/s  "
+          f"p50 {run['p50']:6.2f}s  p95 {run['p95']:6.2f}s  p99 {run['p99']:6.2f}s  "
+          f"{run['cpu_ms_per_page']:6.2f} ms CPU/page ({run['pages']} pages)  "
+          f"peak RSS {run['peak_rss_mb']:.0f} MB (parser workers {run['peak_worker_rss_mb']:.0f} MB)")
+    if run["mismatches"]:
+        print(f"       {len(run['mismatches'])} sites differ from the planted emails, e.g.:")
+        for mismatch in run["mismatches"][:MISMATCH_EXAMPLES]:
+            print(f"         {mismatch}")
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    engine_options = {"max_concurrency": args.concurrency, "per_host_limit": args.per_host,
+                      "timeout": args.timeout, "parse_workers": args.parse_workers}
+
+    # The fixture server gets its own process so serving pages doesn't take CPU time from the crawl being measured
+    context = multiprocessing.get_context("spawn")
+    port_queue = context.Queue()
+    server = context.Process(target=serve_fixtures, args=(port_queue, args.seed), daemon=True)
+    server.start()
+    port = port_queue.get(timeout=30)
+
+    runs = []
+    results = {}
+    try:
+        for size in sizes:
+            with ProcessPoolExecutor(1, mp_context=context) as executor:
+                run = executor.submit(run_size, size, port, args.seed, engine_options).result()
+            print_report(run)
+            results.update(run.pop("results"))
+            runs.append(run)
+    finally:
+        server.terminate()
+
+    failed = any(run["mismatches"] for run in runs)
+    if args.check_baseline:
+        with open(args.check_baseline) as f:
+            changed = compare_baseline(results, json.load(f))
+        if changed:
+            failed = True
+            print(f"{len(changed)} sites differ from the baseline, e.g.:")
+            for change in changed[:MISMATCH_EXAMPLES]:
+                print(f"  {change}")
+        else:
+            print("Extracted emails match the baseline")
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(runs, f, indent=1)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,22 @@
+import importlib
+
+# Public names and the modules they come from. Modules are imported on first use, so a parser
+# worker importing fs_em.extract doesn't also load the crawler, HTTP transport and job code.
+EXPORTS = {
+    "validate_email": "extract", "get_domain": "domains", "clean_and_deduplicate_emails": "extract",
+    "extract_emails_from_html": "extract", "prioritize_emails": "extract",
+    "PooledTransport": "transport",
+    "CrawlCache": "cache",
+    "CrawlEngine": "crawler", "extract_emails": "crawler", "crawl_websites": "crawler",
+    "normalize_website": "inputs", "read_websites": "inputs",
+    "JobJournal": "jobs", "open_journal": "jobs", "start_job": "jobs", "spawn_worker": "jobs",
+    "run_worker": "worker",
+}
+__all__ = list(EXPORTS)
+
+def __getattr__(name):
+    if name not in EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
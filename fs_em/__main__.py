@@ -0,0 +1,7 @@
+import sys
+
+from .cli import main
+
+# Guarded so parser processes, which re-import the main module, don't start another run
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import zlib
+import httpx
+from urllib.parse import urlparse
+
+from .config import (CACHE_PATH, PAGE_CACHE_TTL, RESULT_CACHE_TTL, CACHE_MAX_AGE, CACHE_MAX_BYTES,
+                     PAGE_CACHE_MAX_BODY, CACHE_EVICT_EVERY, CACHED_HEADERS, RETRY_STATUSES, CACHE_LOCK_TIMEOUT)
+
+# Function to normalize a website to the key its cached result is stored under: the host
+# without www. plus any path and query, since on hosts like facebook.com/<page> the path is the site
+def result_key(url):
+    if not url.startswith(('http://', 'https://')):
+        url = 'https://' + url
+    parts = urlparse(url)
+    host = parts.netloc.lower()
+    host = host[4:] if host.startswith("www.") else host
+    return host + parts.path.rstrip("/") + (f"?{parts.query}" if parts.query else "")
+
+# Persistent SQLite cache of fetched pages (keyed by final URL) and finished site results.
+# Stale pages are kept so they can be revalidated with a conditional GET. Worker processes may
+# share the file, so reads never hold a write transaction open: the access times of page hits
+# are kept in memory and written with the next write.
+class CrawlCache:
+    def __init__(self, path=CACHE_PATH, page_ttl=PAGE_CACHE_TTL, result_ttl=RESULT_CACHE_TTL,
+                 max_bytes=CACHE_MAX_BYTES, max_age=CACHE_MAX_AGE):
+        self.path = path
+        self.page_ttl = page_ttl
+        self.result_ttl = result_ttl
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.stats = {"page_hits": 0, "page_revalidated": 0, "page_misses": 0, "result_hits": 0}
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._accessed = {}  # Final URL -> time of its last cache hit, not written yet
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Wait for other processes' writes rather than fail
+        self._db = sqlite3.connect(path, timeout=CACHE_LOCK_TIMEOUT, check_same_thread=False)
+        self._db.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS pages (
+                final_url TEXT PRIMARY KEY, status INTEGER, headers TEXT, body BLOB, size INTEGER,
+                etag TEXT, last_modified TEXT, fetched_at REAL, accessed_at REAL);
+            CREATE TABLE IF NOT EXISTS redirects (url TEXT PRIMARY KEY, final_url TEXT);
+            CREATE TABLE IF NOT EXISTS results (domain TEXT PRIMARY KEY, emails TEXT, stored_at REAL);
+            CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed_at);
+        """)
+
+    def close(self):
+        with self._lock:
+            if self._accessed:
+                self._write_accessed()
+                self._db.commit()
+            self._db.close()
+
+    # Write the pending access times; the caller holds the lock and commits
+    def _write_accessed(self):
+        self._db.executemany("UPDATE pages SET accessed_at = ? WHERE final_url = ?",
+                             [(accessed_at, final_url) for final_url, accessed_at in self._accessed.items()])
+        self._accessed.clear()
+
+    # Look up a page by the URL that was requested, following any recorded redirect.
+    # Returns None on a miss, otherwise a dict with the stored response and whether it is still fresh.
+    def get_page(self, url):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT final_url, status, headers, body, etag, last_modified, fetched_at FROM pages "
+                "WHERE final_url = COALESCE((SELECT final_url FROM redirects WHERE url = ?), ?)", (url, url)).fetchone()
+            if row is None:
+                self.stats["page_misses"] += 1
+                return None
+            self._accessed[row[0]] = now
+        final_url, status, headers, body, etag, last_modified, fetched_at = row
+        return {"final_url": final_url, "status": status, "headers": json.loads(headers),
+                "body": zlib.decompress(body), "etag": etag, "last_modified": last_modified,
+                "fresh": now - fetched_at < self.page_ttl}
+
+    # Store a fetched page; server errors and statuses that are retried (e.g. 429) are not kept
+    def store_page(self, url, response):
+        content = response.content
+        if response.status_code >= 500 or response.status_code in RETRY_STATUSES or len(content) > PAGE_CACHE_MAX_BODY:
+            return
+        final_url = str(response.url)
+        # Only headers that still apply to the decoded body are kept
+        headers = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+        body = zlib.compress(content)
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             (final_url, response.status_code, json.dumps(headers), body, len(body),
+                              response.headers.get("etag"), response.headers.get("last-modified"), now, now))
+            if url != final_url:
+                self._db.execute("INSERT OR REPLACE INTO redirects VALUES (?, ?)", (url, final_url))
+            self._write_accessed()
+            self._db.commit()
+            self._writes += 1
+            if self._writes % CACHE_EVICT_EVERY == 0:
+                self._evict()
+
+    # A 304 answer means the stored page is current again
+    def mark_revalidated(self, entry):
+        now = time.time()
+        with self._lock:
+            self.stats["page_revalidated"] += 1
+            self._db.execute("UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE final_url = ?",
+                             (now, now, entry["final_url"]))
+            self._write_accessed()
+            self._db.commit()
+
+    def record_hit(self):
+        with self._lock:
+            self.stats["page_hits"] += 1
+
+    def get_result(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT emails, stored_at FROM results WHERE domain = ?", (key,)).fetchone()
+            if row is None or time.time() - row[1] >= self.result_ttl:
+                return None
+            self.stats["result_hits"] += 1
+        return json.loads(row[0])
+
+    def store_result(self, key, emails):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (key, json.dumps(emails), time.time()))
+            self._write_accessed()
+            self._db.commit()
+
+    # Drop pages past the maximum age, then the least recently used ones until under the size limit
+    def _evict(self):
+        self._db.execute("DELETE FROM pages WHERE fetched_at < ?", (time.time() - self.max_age,))
+        self._db.execute("DELETE FROM results WHERE stored_at < ?", (time.time() - self.max_age,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total > self.max_bytes:
+            removed = 0
+            for final_url, size in self._db.execute("SELECT final_url, size FROM pages ORDER BY accessed_at").fetchall():
+                if total - removed <= self.max_bytes * 0.9:
+                    break
+                self._db.execute("DELETE FROM pages WHERE final_url = ?", (final_url,))
+                removed += size
+        self._db.execute("DELETE FROM redirects WHERE final_url NOT IN (SELECT final_url FROM pages)")
+        self._db.commit()
+
+    # Remove everything, or only the stored site results
+    def purge(self, results_only=False):
+        with self._lock:
+            self._db.execute("DELETE FROM results")
+            self._write_accessed()
+            if not results_only:
+                self._db.execute("DELETE FROM pages")
+                self._db.execute("DELETE FROM redirects")
+            self._db.commit()
+            self._db.execute("VACUUM")
+
+# Function to rebuild a response from a cached page
+def cached_response(entry):
+    return httpx.Response(entry["status"], headers=entry["headers"], content=entry["body"],
+                          request=httpx.Request("GET", entry["final_url"]))
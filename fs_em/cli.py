@@ -0,0 +1,189 @@
+import sys
+import csv
+import json
+import time
+import asyncio
+import argparse
+import itertools
+import httpx
+
+from .config import (REQUEST_TIMEOUT, MAX_CONCURRENCY, PER_HOST_LIMIT, HTTP2_AVAILABLE, CACHE_PATH, PARSE_WORKERS,
+                     CONNECT_TIMEOUT, SITE_TIME_BUDGET, RETRY_ATTEMPTS, MAX_PAGE_BYTES, SUFFIX_LIST_PATH)
+from .extract import HTML_PARSER
+from .domains import update_suffix_list
+from .cache import CrawlCache
+from .crawler import CrawlEngine
+from .inputs import read_websites
+from .metrics import METRICS_COLUMNS, metrics_row, format_breakdown, make_profiler
+
+# Writes each site's result as a "Website,Email" row per email, like the UI's emails.csv
+class CsvResultWriter:
+    def __init__(self, stream):
+        self.stream = stream
+        self.writer = csv.writer(stream)
+        self.writer.writerow(["Website", "Email"])
+
+    def write(self, website, emails):
+        for email in emails or [""]:
+            self.writer.writerow([website, email])
+        self.stream.flush()
+
+# Writes each site's result as one JSON object per line
+class JsonlResultWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, website, emails):
+        self.stream.write(json.dumps({"website": website, "emails": emails}) + "\n")
+        self.stream.flush()
+
+# Writes each site's timing and failure metrics: a flat CSV row per site, or for any other
+# extension one JSON object per line that also lists every request the site made
+class MetricsWriter:
+    def __init__(self, path):
+        self.stream = open(path, "w", newline="", encoding="utf-8")
+        self.writer = None
+        if path.endswith(".csv"):
+            self.writer = csv.DictWriter(self.stream, fieldnames=METRICS_COLUMNS)
+            self.writer.writeheader()
+
+    def write(self, index, website, metrics):
+        if self.writer:
+            self.writer.writerow(metrics_row(metrics))
+        else:
+            self.stream.write(json.dumps(metrics) + "\n")
+
+    def close(self):
+        self.stream.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m fs_em",
+                                     description="Extract contact emails from a list of websites.")
+    parser.add_argument("input", nargs="?", default="-",
+                        help="CSV file, Google Sheets link, or - for stdin (one URL per line unless --column is given)")
+    parser.add_argument("-c", "--column", help="column holding the websites (default: guessed from the header)")
+    parser.add_argument("-o", "--output", default="-", help="output file, or - for stdout (default)")
+    parser.add_argument("-f", "--format", choices=["csv", "jsonl"],
+                        help="output format (default: from the output file extension, else csv)")
+    parser.add_argument("--unordered", action="store_true",
+                        help="write each site as soon as it finishes instead of in input order")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY,
+                        help=f"requests in flight across all sites (default: {MAX_CONCURRENCY})")
+    parser.add_argument("--per-host", type=int, default=PER_HOST_LIMIT,
+                        help=f"requests in flight against any single host (default: {PER_HOST_LIMIT})")
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT,
+                        help=f"most seconds to wait for a response; shorter for hosts that answer fast "
+                             f"(default: {REQUEST_TIMEOUT})")
+    parser.add_argument("--connect-timeout", type=float, default=CONNECT_TIMEOUT,
+                        help=f"most seconds to open a connection (default: {CONNECT_TIMEOUT})")
+    parser.add_argument("--site-budget", type=float, default=SITE_TIME_BUDGET,
+                        help=f"seconds per site before it is finished with the emails found so far; 0 for no limit "
+                             f"(default: {SITE_TIME_BUDGET})")
+    parser.add_argument("--retries", type=int, default=RETRY_ATTEMPTS,
+                        help=f"retries after transient errors, with backoff (default: {RETRY_ATTEMPTS})")
+    parser.add_argument("--max-page-bytes", type=int, default=MAX_PAGE_BYTES,
+                        help=f"stop reading any response after this many bytes (default: {MAX_PAGE_BYTES})")
+    parser.add_argument("--parse-workers", type=int, default=PARSE_WORKERS,
+                        help=f"parser processes; 0 parses on threads in this process (default: {PARSE_WORKERS})")
+    parser.add_argument("--parser", default=HTML_PARSER, help=f"BeautifulSoup parser (default: {HTML_PARSER})")
+    parser.add_argument("--no-http2", action="store_true", help="disable HTTP/2")
+    parser.add_argument("--keep-duplicates", action="store_true",
+                        help="crawl every row as given instead of once per domain")
+    parser.add_argument("--no-cache", action="store_true", help="don't read or write the crawl cache")
+    parser.add_argument("--refresh-cache", action="store_true", help="ignore cached pages and results but store new ones")
+    parser.add_argument("--purge-cache", action="store_true", help="empty the crawl cache before running")
+    parser.add_argument("--cache-path", default=CACHE_PATH, help="crawl cache file")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="write per-site timing and failures to PATH (.csv, else JSON lines) and print a breakdown")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="profile the run and write the report to PATH (use --parse-workers 0 to include parsing)")
+    parser.add_argument("--profiler", choices=["auto", "pyinstrument", "cprofile"], default="auto",
+                        help="pyinstrument samples (HTML for .html paths, else text); cprofile writes pstats "
+                             "(default: pyinstrument when installed)")
+    parser.add_argument("--update-suffix-list", action="store_true",
+                        help=f"download the current public suffix list to {SUFFIX_LIST_PATH} and exit "
+                             "(runs use it from then on instead of the bundled snapshot)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="don't report progress on stderr")
+    return parser.parse_args(argv)
+
+# Function to crawl every website and hand each result to the writer as it becomes available
+async def stream_results(engine, websites, writer, ordered=True, on_progress=None):
+    waiting = {}  # Finished sites held back until every earlier site is written
+    next_index = 0
+    async with engine:
+        async for index, website, emails in engine.crawl_iter(websites):
+            if on_progress:
+                on_progress(emails)
+            if not ordered:
+                writer.write(website, emails)
+                continue
+            waiting[index] = (website, emails)
+            while next_index in waiting:
+                writer.write(*waiting.pop(next_index))
+                next_index += 1
+
+def main(argv=None):
+    args = parse_args(argv)
+    output_format = args.format or ("jsonl" if args.output.endswith((".jsonl", ".ndjson")) else "csv")
+    if args.update_suffix_list:
+        try:
+            update_suffix_list()
+        except (ValueError, OSError, httpx.HTTPError) as exc:
+            print(f"error: {exc}", file=sys.stderr)
+            return 1
+        return 0
+
+    cache = None
+    if not args.no_cache:
+        cache = CrawlCache(args.cache_path)
+        if args.purge_cache:
+            cache.purge()
+    metrics_writer = MetricsWriter(args.metrics) if args.metrics else None
+    profiler = make_profiler(args.profiler) if args.profile else None
+    engine = CrawlEngine(max_concurrency=args.concurrency, per_host_limit=args.per_host, timeout=args.timeout,
+                         connect_timeout=args.connect_timeout, site_budget=args.site_budget, retries=args.retries,
+                         max_page_bytes=args.max_page_bytes, group_domains=not args.keep_duplicates,
+                         parse_workers=args.parse_workers, parser=args.parser,
+                         http2=HTTP2_AVAILABLE and not args.no_http2, cache=cache, refresh_cache=args.refresh_cache,
+                         on_metrics=metrics_writer.write if metrics_writer else None, profiler=profiler)
+
+    progress = {"done": 0, "emails": 0}
+    start_time = time.time()
+
+    def on_progress(emails):
+        progress["done"] += 1
+        progress["emails"] += len(emails)
+        if not args.quiet:
+            rate = progress["done"] / max(time.time() - start_time, 1e-6)
+            print(f"\rSites: {progress['done']} | Emails: {progress['emails']} | {rate:.1f} sites/sec",
+                  end="", file=sys.stderr, flush=True)
+
+    stream = None
+    try:
+        # The first row is read before the output is created, so an input that can't be read
+        # leaves no header or empty file behind
+        websites = read_websites(args.input, args.column)
+        first = next(websites, None)
+        websites = itertools.chain([] if first is None else [first], websites)
+        stream = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+        writer = (JsonlResultWriter if output_format == "jsonl" else CsvResultWriter)(stream)
+        asyncio.run(stream_results(engine, websites, writer, ordered=not args.unordered, on_progress=on_progress))
+    except (ValueError, OSError, httpx.HTTPError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if stream not in (None, sys.stdout):
+            stream.close()
+        if cache:
+            cache.close()
+        if not args.quiet and progress["done"]:
+            print(file=sys.stderr)
+        if metrics_writer:
+            metrics_writer.close()
+            if not args.quiet:
+                print(format_breakdown(engine.metrics_summary()), file=sys.stderr)
+        if profiler:
+            profiler.write(args.profile)
+    return 0
@@ -0,0 +1,91 @@
+import os
+import importlib.util
+
+IGNORE_DOMAINS = ["wix.com", "domain.com", "example.com", "sentry.io", "wixpress.com", "squarespace.com", "wordpress.com", "shopify.com"]
+
+EMAIL_CACHE_SIZE = 100000  # Addresses whose validation verdict is remembered across a batch
+
+COMMON_EMAIL_DOMAINS = ["gmail.com", "yahoo.com", "outlook.com", "hotmail.com", "aol.com", "icloud.com", 
+                        "protonmail.com", "mail.com", "zoho.com", "yandex.com", "gmx.com"]
+CONTACT_PAGES = ["/contact", "/contact-us", "/contact.html", "/contact-us.html", "/about", "/about-us", 
+                "/about.html", "/about-us.html", "/get-in-touch", "/reach-us", "/connect", "/reach-out",
+                "/our-team", "/team", "/support", "/help", "/info"]
+
+DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"}
+REQUEST_TIMEOUT = 15  # Seconds to wait for a response; the adaptive read timeout never exceeds it
+MAX_CONCURRENCY = 20  # Requests in flight across all sites
+PER_HOST_LIMIT = 4  # Requests in flight against any single host
+
+# Streamed downloads
+MAX_PAGE_BYTES = 5 * 1024 * 1024  # Decoded bytes read from any one response; the rest is never downloaded
+# Content types worth reading (a missing Content-Type is read too); anything else is closed unread
+PAGE_CONTENT_TYPES = ["text/html", "application/xhtml+xml", "text/plain", "application/xml", "text/xml"]
+
+# Dead hosts, adaptive timeouts and retries
+CONNECT_TIMEOUT = 5  # Seconds to open a connection; the adaptive connect timeout never exceeds it
+MIN_CONNECT_TIMEOUT = 1  # Adaptive timeouts never drop below these
+MIN_READ_TIMEOUT = 3
+TIMEOUT_LATENCY_FACTOR = 4  # Adaptive timeouts allow this many times the host's usual connect/response time
+LATENCY_SMOOTHING = 0.3  # Weight of the newest sample in a host's moving average latency
+SITE_TIME_BUDGET = 60  # Seconds one site may take before it is finished with the emails found so far
+BREAKER_THRESHOLD = 2  # Timeouts in a row before a host counts as unreachable (DNS, refused and TLS errors: one)
+BREAKER_RESET_AFTER = 300  # Seconds an unreachable host is skipped before it is tried again
+RETRY_ATTEMPTS = 2  # Extra tries after a transient error (connect timeout, dropped connection, 429/502/503/504)
+RETRY_BACKOFF = 0.5  # Seconds before the first retry, doubled for each one after
+RETRY_BACKOFF_MAX = 4  # Seconds any single retry waits at most, including Retry-After
+RETRY_STATUSES = [429, 502, 503, 504]
+
+# Parsing runs in a pool of worker processes fed through a bounded queue
+PARSE_WORKERS = max(0, (os.cpu_count() or 1) - 1)  # Parser processes; 0 parses on threads in this process
+PARSE_QUEUE_PER_WORKER = 4  # Fetched pages allowed to wait per parser before fetching pauses
+
+# Connection pool shared by every fetch in a crawl
+POOL_MAX_CONNECTIONS = 100  # Open connections across all hosts
+POOL_MAX_KEEPALIVE = 50  # Idle connections kept open for reuse
+KEEPALIVE_EXPIRY = 30  # Seconds an idle connection stays open
+DNS_CACHE_TTL = 300  # Seconds a resolved address is reused
+DNS_FAILURE_TTL = 60  # Seconds a failed lookup is remembered
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None  # HTTP/2 needs the h2 package
+
+# Per-site timing and failure metrics
+SLOWEST_SITES = 10  # Slowest sites listed in the timing breakdown
+
+# Local state (crawl cache and job journal)
+DATA_DIR = os.path.join(os.path.expanduser("~"), ".cache", "fs-em")
+JOBS_PATH = os.path.join(DATA_DIR, "jobs.sqlite3")
+JOB_QUEUE = os.environ.get("FS_EM_JOB_QUEUE", JOBS_PATH)  # Job queue shared by the UI and workers: a SQLite path or backend URL
+JOB_UNIT_SIZE = 100  # Sheet rows per work unit leased by a worker
+JOB_HEARTBEAT_INTERVAL = 2  # Seconds between a worker's heartbeats and lease renewals
+JOB_STALE_AFTER = 30  # Seconds without a heartbeat before a worker counts as gone and its unit is leased again
+JOB_MAX_ATTEMPTS = 3  # Failed or expired leases of one unit before its job is marked failed
+JOB_POLL_INTERVAL = 1  # Seconds an idle worker waits before looking for work again
+WORKER_IDLE_EXIT = 300  # Seconds a worker started from the UI waits for work before exiting
+THROUGHPUT_WINDOW = 60  # Seconds of recent results a worker's throughput is measured over
+JOB_REFRESH_INTERVAL = 2  # Seconds between live progress updates in the UI
+RESULTS_DIR = os.path.join(DATA_DIR, "results")  # CSV exports of job results
+RESULTS_PAGE_SIZE = 200  # Sites per page of the results table in the UI
+RESULTS_BATCH_SIZE = 1000  # Sites read from the journal at a time when exporting a CSV
+
+# Public suffix list, for telling registrable domains apart. Nothing is downloaded at startup:
+# the list saved at SUFFIX_LIST_PATH (python -m fs_em --update-suffix-list) is used when present,
+# otherwise the snapshot bundled with tldextract.
+SUFFIX_LIST_URL = "https://publicsuffix.org/list/public_suffix_list.dat"
+SUFFIX_LIST_PATH = os.path.join(DATA_DIR, "public_suffix_list.dat")
+DOMAIN_CACHE_SIZE = 100000  # Hosts whose parsed domain is remembered
+
+# On-disk crawl cache
+CACHE_PATH = os.path.join(DATA_DIR, "crawl_cache.sqlite3")
+PAGE_CACHE_TTL = 24 * 3600  # Seconds a cached page is used without asking the server
+RESULT_CACHE_TTL = 24 * 3600  # Seconds a site's finished email list is reused
+CACHE_MAX_AGE = 30 * 24 * 3600  # Seconds a stale page is kept for conditional revalidation
+CACHE_MAX_BYTES = 500 * 1024 * 1024  # Compressed page bytes kept before evicting the least recently used
+PAGE_CACHE_MAX_BODY = 5 * 1024 * 1024  # Larger pages are not cached
+CACHE_EVICT_EVERY = 200  # Page writes between eviction passes
+CACHE_LOCK_TIMEOUT = 60  # Seconds to wait for another worker process's write to the cache file
+CACHED_HEADERS = ["content-type", "etag", "last-modified"]
+
+# Words that mark a link as a likely contact page, with how strongly they do so
+CONTACT_KEYWORDS = {"contact": 10, "kontakt": 10, "get-in-touch": 9, "reach-us": 8, "reach-out": 8, "connect": 6,
+                    "about": 5, "team": 4, "impressum": 4, "imprint": 4, "support": 3, "help": 2, "info": 2}
+NAV_LINK_BONUS = 2  # Extra score for links found in the site's nav, header or footer
+MAX_CONTACT_PAGES = 6  # Discovered pages fetched per site
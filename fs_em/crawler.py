@@ -0,0 +1,453 @@
+import os
+import time
+import asyncio
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import httpx
+from urllib.parse import urljoin, urlparse
+
+from .config import (CONTACT_PAGES, DEFAULT_HEADERS, REQUEST_TIMEOUT, MAX_CONCURRENCY, PER_HOST_LIMIT,
+                     HTTP2_AVAILABLE, PARSE_WORKERS, PARSE_QUEUE_PER_WORKER, CONNECT_TIMEOUT, SITE_TIME_BUDGET,
+                     RETRY_ATTEMPTS, RETRY_STATUSES, MAX_PAGE_BYTES)
+from .extract import (HTML_PARSER, get_domain, clean_and_deduplicate_emails, has_email_markers, clean_candidates,
+                      find_sitemap_urls, rank_contact_pages, parse_page_content, parse_homepage_content,
+                      prioritize_emails)
+from .transport import PooledTransport, read_body
+from .cache import result_key, cached_response
+from .metrics import SiteMetrics, MetricsSummary, RequestTimer, CircuitOpenError, current_request, classify_error
+from .health import HostHealth, is_transient, backoff_delay
+from .inputs import canonical_website
+
+# Async crawl engine: bounded global concurrency plus a per-host request limit.
+# Pages move through three stages: async fetchers put raw bytes on a bounded parse queue,
+# parser workers (separate processes unless parse_workers is 0) extract emails, and each
+# site's extract_emails collects and merges its pages' results. A full queue pauses fetching.
+# Every site's request and parse timings and failures are collected as SiteMetrics; on_metrics(index,
+# website, metrics) receives each one, and profiler (anything with start() and stop()) wraps the run.
+# Hosts that turn out to be unreachable are skipped by a per-host circuit breaker, timeouts adapt
+# to each host's latency (timeout and connect_timeout are the upper bounds), transient errors are
+# retried with backoff, and no site takes longer than site_budget seconds. Bodies are streamed:
+# non-page content types are never downloaded and no response is read past max_page_bytes.
+# With group_domains, rows are canonicalized and each registrable domain is crawled once, its
+# result going to every row that names it.
+class CrawlEngine:
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, per_host_limit=PER_HOST_LIMIT, timeout=REQUEST_TIMEOUT,
+                 parser=HTML_PARSER, http2=HTTP2_AVAILABLE, transport_options=None, cache=None, refresh_cache=False,
+                 parse_workers=PARSE_WORKERS, parse_queue_size=None, on_metrics=None, profiler=None,
+                 connect_timeout=CONNECT_TIMEOUT, site_budget=SITE_TIME_BUDGET, retries=RETRY_ATTEMPTS,
+                 max_page_bytes=MAX_PAGE_BYTES, group_domains=True):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.per_host_limit = max(1, int(per_host_limit))
+        self.timeout = timeout
+        self.connect_timeout = min(connect_timeout, timeout)
+        self.site_budget = site_budget or None  # Seconds per site; None (or 0) for no limit
+        self.retries = max(0, int(retries))
+        self.max_page_bytes = max(1, int(max_page_bytes))
+        self.group_domains = group_domains
+        self.parser = parser
+        self.parse_workers = max(0, int(parse_workers))
+        # Without worker processes, parse on as many threads as the default thread pool would use
+        self._parse_concurrency = self.parse_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.parse_queue_size = parse_queue_size or self._parse_concurrency * PARSE_QUEUE_PER_WORKER
+        self.http2 = http2
+        self.transport_options = transport_options or {}
+        self.cache = cache  # CrawlCache, or None to always fetch
+        self.refresh_cache = refresh_cache  # Ignore cached pages and results but store fresh ones
+        self.on_metrics = on_metrics
+        self.profiler = profiler
+        self.metrics = MetricsSummary()
+        self.transport = None
+        self.client = None
+        self._request_limit = None
+        self._host_limits = {}
+        self._host_health = {}
+        self._executor = None
+        self._parse_queue = None
+        self._parsers = []
+
+    async def __aenter__(self):
+        if self.profiler:
+            self.profiler.start()
+        self.transport = PooledTransport(http2=self.http2, **self.transport_options)
+        self.client = httpx.AsyncClient(headers=DEFAULT_HEADERS, timeout=self.timeout, follow_redirects=True,
+                                        transport=self.transport)
+        self._request_limit = asyncio.Semaphore(self.max_concurrency)
+        if self.parse_workers:
+            self._executor = self._make_executor()
+        self._parse_queue = asyncio.Queue(maxsize=self.parse_queue_size)
+        self._parsers = [asyncio.create_task(self._parse_worker()) for _ in range(self._parse_concurrency)]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        try:
+            for task in self._parsers:
+                task.cancel()
+            await asyncio.gather(*self._parsers, return_exceptions=True)
+            if self._executor:
+                await asyncio.to_thread(self._executor.shutdown, cancel_futures=True)
+            await self.client.aclose()
+        finally:
+            if self.profiler:
+                self.profiler.stop()
+
+    def _make_executor(self):
+        # Spawned rather than forked: the engine may run on a thread of a multi-threaded process (Streamlit, jobs)
+        return ProcessPoolExecutor(self.parse_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    # Hands queued pages to the executor one at a time, so at most _parse_concurrency
+    # pages are being parsed and the rest wait in the bounded queue
+    async def _parse_worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            function, args, future = await self._parse_queue.get()
+            try:
+                executor = self._executor
+                try:
+                    result = await loop.run_in_executor(executor, function, *args)
+                except BrokenProcessPool:
+                    # A parser process died (out of memory, a crash on an odd page) and took the pool with
+                    # it, so every later page would fail too: replace the pool and try the page once more
+                    if self._executor is executor:
+                        self._executor = self._make_executor()
+                        executor.shutdown(wait=False, cancel_futures=True)
+                    result = await loop.run_in_executor(self._executor, function, *args)
+                if not future.done():
+                    future.set_result(result)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as exc:
+                if not future.done():
+                    future.set_exception(exc)
+
+    # Queue a parse job and wait for its result; waits for room when the queue is full.
+    # The function returns its result followed by a dict of its timings, which go to site.
+    async def parse(self, function, *args, site=None):
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        await self._parse_queue.put((function, args, future))
+        *result, timings = await future
+        if site is not None:
+            # Whatever the worker didn't account for was spent waiting in the queue or the pool
+            timings["parse_wait"] = max(0.0, time.perf_counter() - start - sum(timings.values()))
+            site.add_timings(timings)
+        return result[0] if len(result) == 1 else tuple(result)
+
+    # Connection reuse, DNS cache and transfer statistics for everything fetched so far
+    def transport_stats(self):
+        return self.transport.summary() if self.transport else {}
+
+    # Time per phase, failure counts and slowest sites over every site crawled so far
+    def metrics_summary(self):
+        return self.metrics.summary()
+
+    def _host_limit(self, url):
+        host = urlparse(url).netloc.lower()
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_limits[host]
+
+    def host_health(self, url):
+        host = urlparse(url).netloc.lower()
+        if host not in self._host_health:
+            self._host_health[host] = HostHealth()
+        return self._host_health[host]
+
+    # Fetch a page, waiting for both a global and a per-host slot. Fresh cached pages skip
+    # the network; stale ones are revalidated with If-None-Match / If-Modified-Since.
+    # With a site, each attempt's timings and outcome (or why it failed) are recorded on it.
+    # Raises CircuitOpenError without sending anything once the host counts as unreachable.
+    async def fetch(self, url, site=None, role="page"):
+        health = self.host_health(url)
+        for attempt in range(self.retries + 1):
+            if health.is_open():
+                if site is not None:
+                    site.add_failure("circuit_open")
+                raise CircuitOpenError(f"{urlparse(url).netloc} is unreachable")
+            timer = RequestTimer()
+            start = time.perf_counter()
+            try:
+                # Retries go to the network: the cache could only hand back the response being retried
+                response = await self._fetch(url, timer, health.timeout(self.connect_timeout, self.timeout),
+                                             use_cache=attempt == 0)
+            except Exception as exc:
+                kind = classify_error(exc)
+                health.record_failure(kind)
+                if site is not None:
+                    site.add_request(url, role, timings=timer.result(), error=kind, seconds=time.perf_counter() - start)
+                if attempt < self.retries and is_transient(exc):
+                    await asyncio.sleep(backoff_delay(attempt))
+                    continue
+                raise
+            timings = timer.result()
+            health.record_success(timings)
+            if site is not None:
+                site.add_request(url, role, response, timings, seconds=time.perf_counter() - start)
+                if response.extensions.get("body_cut"):
+                    site.add_failure(response.extensions["body_cut"])
+            if attempt < self.retries and response.status_code in RETRY_STATUSES:
+                await asyncio.sleep(backoff_delay(attempt, response.headers.get("Retry-After")))
+                continue
+            return response
+
+    async def _fetch(self, url, timer, timeout, use_cache=True):
+        entry = None
+        headers = {}
+        if self.cache and use_cache and not self.refresh_cache:
+            start = time.perf_counter()
+            entry = await asyncio.to_thread(self.cache.get_page, url)
+            timer.add("cache", time.perf_counter() - start)
+            if entry and entry["fresh"]:
+                self.cache.record_hit()
+                return cached_response(entry)
+            if entry and entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry and entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        start = time.perf_counter()
+        async with self._request_limit, self._host_limit(url):
+            timer.add("fetch_wait", time.perf_counter() - start)
+            token = current_request.set(timer)
+            try:
+                request = self.client.build_request("GET", url, headers=headers, timeout=timeout,
+                                                    extensions={"trace": timer.trace})
+                response = await self.client.send(request, stream=True)
+                cut, candidates = await read_body(response, self.max_page_bytes)
+            finally:
+                current_request.reset(token)
+            self.transport.record_response(response)
+        response.extensions["body_cut"] = cut
+        response.extensions["stream_candidates"] = candidates
+
+        if self.cache:
+            start = time.perf_counter()
+            if response.status_code == 304 and entry:
+                await asyncio.to_thread(self.cache.mark_revalidated, entry)
+                timer.add("cache", time.perf_counter() - start)
+                return cached_response(entry)
+            # A truncated body would be served later as if it were the whole page; a skipped
+            # non-page body is empty either way, so that one can be kept
+            if cut in (None, "content_type"):
+                await asyncio.to_thread(self.cache.store_page, url, response)
+            timer.add("cache", time.perf_counter() - start)
+        return response
+
+    # Fetch a page, returning None instead of raising on network errors (they are recorded on site)
+    async def try_fetch(self, url, site=None, role="page"):
+        try:
+            return await self.fetch(url, site, role)
+        except Exception:
+            return None
+
+    # Parse a fetched page in the parser pool so other fetches keep going
+    async def parse_page(self, response, is_contact_page=False, site=None):
+        try:
+            return await self.parse(parse_page_content, response.content, response.encoding, is_contact_page,
+                                    self.parser, site=site)
+        except Exception:
+            if site is not None:
+                site.add_failure("parse_error")
+            return set()
+
+    # Function to extract a site's emails; its timings and failures are recorded on site
+    # (a fresh SiteMetrics if none is given) and added to the engine's summary
+    async def extract_emails(self, base_url, site=None):
+        site = site or SiteMetrics(base_url)
+        cache_key = result_key(base_url)
+        if self.cache and not self.refresh_cache:
+            start = time.perf_counter()
+            cached_emails = await asyncio.to_thread(self.cache.get_result, cache_key)
+            site.add_timings({"cache": time.perf_counter() - start})
+            if cached_emails is not None:
+                site.cached = True
+                site.finish(cached_emails)
+                self.metrics.add(site)
+                return cached_emails
+
+        emails_set = set()  # Use set to store unique emails (case insensitive)
+        domain = get_domain(base_url)
+        complete = False
+        try:
+            async with asyncio.timeout(self.site_budget):
+                complete = await self._crawl_pages(base_url, site, emails_set)
+        except TimeoutError:
+            # Out of time: finish with whatever was found so far
+            site.add_failure("budget")
+            site.error = site.error or "budget"
+
+        # Clean and deduplicate emails
+        start = time.perf_counter()
+        all_emails = clean_and_deduplicate_emails(list(emails_set), validated=True)
+        sorted_emails = prioritize_emails(all_emails, domain)
+        site.add_timings({"dedupe": time.perf_counter() - start})
+        if self.cache and complete:
+            start = time.perf_counter()
+            await asyncio.to_thread(self.cache.store_result, cache_key, sorted_emails)
+            site.add_timings({"cache": time.perf_counter() - start})
+        site.finish(sorted_emails)
+        self.metrics.add(site)
+        return sorted_emails
+
+    # Fetch and parse a site's homepage, sitemap and contact pages, adding their emails to
+    # emails_set. Returns whether the homepage was fetched with a non-error status (so the result
+    # is worth caching; a 404, 429 or 503 homepage may well work next time).
+    async def _crawl_pages(self, base_url, site, emails_set):
+        seen_urls = set()
+        seen_hashes = set()
+
+        # Skip pages that redirect to a URL we already parsed or repeat content we already saw
+        # (soft-404s usually serve the homepage again)
+        def is_new_page(response):
+            final_url = str(response.url).rstrip("/")
+            content_hash = hashlib.sha1(response.content).hexdigest()
+            if final_url in seen_urls or content_hash in seen_hashes:
+                return False
+            seen_urls.add(final_url)
+            seen_hashes.add(content_hash)
+            return True
+
+        # A page cut short may end mid-element, so also keep the addresses seen while it streamed in
+        def add_streamed_emails(response):
+            if response.extensions.get("body_cut") in ("too_large", "partial_body"):
+                emails_set.update(clean_candidates(response.extensions["stream_candidates"]))
+
+        # First process the main URL, fetching the sitemap alongside it
+        homepage, sitemap = await asyncio.gather(self.try_fetch(base_url, site, "homepage"),
+                                                 self.try_fetch(urljoin(base_url, "/sitemap.xml"), site, "sitemap"))
+        if homepage is None and self.host_health(base_url).is_open():
+            # The host is unreachable, so probing its contact pages would only fail the same way
+            site.error = site.error or "circuit_open"
+            return False
+        page_url = base_url
+        links = []
+        if homepage is not None:
+            page_url = str(homepage.url)
+            is_new_page(homepage)
+            add_streamed_emails(homepage)
+            try:
+                page_emails, links = await self.parse(parse_homepage_content, homepage.content, homepage.encoding,
+                                                      page_url, self.parser, site=site)
+                emails_set.update(page_emails)
+            except Exception:
+                site.add_failure("parse_error")
+        if sitemap is not None and sitemap.status_code == 200:
+            links.extend((url, "", False) for url in find_sitemap_urls(sitemap.text))
+
+        # Then process the contact pages the site itself links to, falling back to
+        # the common paths only when discovery finds nothing
+        contact_urls = rank_contact_pages(links, page_url)
+        if not contact_urls:
+            contact_urls = [urljoin(page_url, path) for path in CONTACT_PAGES]
+            contact_urls = [url for url in contact_urls if url.rstrip("/") != page_url.rstrip("/")]
+
+        responses = await asyncio.gather(*(self.try_fetch(url, site, "contact") for url in contact_urls))
+        # Pages without any email marker in their raw bytes are never decoded or parsed
+        pages = [response for response in responses
+                 if response is not None and response.status_code < 400 and is_new_page(response)
+                 and has_email_markers(response.content)]
+        for page in pages:
+            add_streamed_emails(page)
+        for page_emails in await asyncio.gather(*(self.parse_page(page, True, site) for page in pages)):
+            emails_set.update(page_emails)
+        return homepage is not None and homepage.status_code < 400
+
+    # Crawl websites concurrently, yielding (index, website, emails) as each site finishes.
+    # The input is consumed lazily and at most max_concurrency finished sites wait to be
+    # collected, so any number of sites can be streamed through in bounded memory.
+    async def crawl_iter(self, websites):
+        pending = enumerate(websites)
+        # A list is already in memory; any other input (e.g. read_websites on stdin, a file or a
+        # sheet download) may block, so it is read on a thread, one row at a time
+        in_memory = isinstance(websites, (list, tuple))
+        read_lock = asyncio.Lock()
+        finished = asyncio.Queue(maxsize=self.max_concurrency)
+        crawled = {}  # Domain key -> (emails, pages fetched) once its crawl has finished
+        waiting = {}  # Domain key -> rows waiting on the crawl in flight, the crawling row first
+
+        async def next_row():
+            if in_memory:
+                return next(pending, None)
+            async with read_lock:
+                return await asyncio.to_thread(next, pending, None)
+
+        async def worker():
+            while True:
+                row = await next_row()
+                if row is None:
+                    return
+                index, website = row
+                key, url = canonical_website(website) if self.group_domains else (website, website)
+                if key in crawled:
+                    emails, pages = crawled[key]
+                    self.metrics.add_duplicate(pages)
+                    await finished.put((index, website, emails))
+                    continue
+                if key in waiting:
+                    # Another worker is crawling this domain; it hands the result to this row too
+                    waiting[key].append((index, website))
+                    continue
+                waiting[key] = [(index, website)]
+                site = SiteMetrics(website)
+                emails = await self.extract_emails(url, site)
+                if self.on_metrics:
+                    self.on_metrics(index, website, site.to_dict())
+                if self.group_domains:
+                    crawled[key] = (emails, len(site.requests))
+                for row_index, row_website in waiting.pop(key):
+                    if row_index != index:
+                        self.metrics.add_duplicate(len(site.requests))
+                    await finished.put((row_index, row_website, emails))
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.max_concurrency)]
+
+        async def close_when_done():
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                await finished.put(None)
+
+        closer = asyncio.create_task(close_when_done())
+        try:
+            while True:
+                item = await finished.get()
+                if item is None:
+                    break
+                yield item
+            await closer  # Re-raise anything a worker failed with
+        finally:
+            for task in workers + [closer]:
+                task.cancel()
+
+    # Crawl many websites concurrently; results are returned in input order.
+    # on_result(index, website, emails) is called as each site finishes.
+    async def crawl(self, websites, on_result=None):
+        websites = list(websites)
+        results = [None] * len(websites)
+        async for index, website, emails in self.crawl_iter(websites):
+            results[index] = emails
+            if on_result:
+                on_result(index, website, emails)
+        return results
+
+# Function to extract emails from a website using multiple methods
+def extract_emails(base_url, **engine_options):
+    # A single site isn't worth starting parser processes for
+    engine_options.setdefault("parse_workers", 0)
+
+    async def run():
+        async with CrawlEngine(**engine_options) as engine:
+            return await engine.extract_emails(base_url)
+    return asyncio.run(run())  # Return as a list instead of a comma-separated string
+
+# Function to extract emails from many websites concurrently (results in input order).
+# Pass an unopened CrawlEngine to read its transport_stats() after the run.
+def crawl_websites(websites, on_result=None, engine=None, **engine_options):
+    engine = engine or CrawlEngine(**engine_options)
+
+    async def run():
+        async with engine:
+            return await engine.crawl(websites, on_result=on_result)
+    return asyncio.run(run())
@@ -0,0 +1,58 @@
+import os
+import re
+from functools import lru_cache
+
+from .config import SUFFIX_LIST_URL, SUFFIX_LIST_PATH, DOMAIN_CACHE_SIZE
+
+# Domain helpers, kept apart from the HTML extraction so input handling and the job queue can
+# use them without loading BeautifulSoup
+
+# The [user@]host[:port] part of a URL, which is all its domain depends on
+NETLOC_PATTERN = re.compile(r"^(?:(?:[a-zA-Z][a-zA-Z0-9+.-]*:)?//)?([^/?#]*)")
+
+# Function to get the public suffix parser, built on first use. It reads the list saved at
+# SUFFIX_LIST_PATH or the snapshot bundled with tldextract and never goes to the network.
+@lru_cache(maxsize=None)
+def suffix_extractor():
+    import tldextract
+    urls = [f"file://{os.path.abspath(SUFFIX_LIST_PATH)}"] if os.path.exists(SUFFIX_LIST_PATH) else []
+    return tldextract.TLDExtract(suffix_list_urls=urls, cache_dir=None, fallback_to_snapshot=True)
+
+# Function to download the current public suffix list to SUFFIX_LIST_PATH for later runs
+def update_suffix_list(path=SUFFIX_LIST_PATH, url=SUFFIX_LIST_URL):
+    import httpx
+    response = httpx.get(url, follow_redirects=True, timeout=30)
+    response.raise_for_status()
+    if "// ===BEGIN ICANN DOMAINS===" not in response.text:
+        raise ValueError(f"{url} did not return a public suffix list")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        f.write(response.text)
+    os.replace(path + ".part", path)
+    suffix_extractor.cache_clear()
+    host_domain.cache_clear()
+    registrable_domain.cache_clear()
+
+# Extract domain from URL
+def get_domain(url):
+    try:
+        return host_domain(NETLOC_PATTERN.match(url).group(1))
+    except:
+        return None
+
+# Function to get a URL host's domain.suffix; memoized, since every link on a page is checked
+# against the page's own domain and most share a handful of hosts
+@lru_cache(maxsize=DOMAIN_CACHE_SIZE)
+def host_domain(netloc):
+    extracted = suffix_extractor()(netloc)
+    return f"{extracted.domain}.{extracted.suffix}"
+
+# Function to get the registrable domain of a hostname (shop.acme.co.uk -> acme.co.uk), or None
+# for IP addresses and bare suffixes. Hosting platforms on the public suffix list count as
+# suffixes, so foo.github.io and bar.github.io stay separate.
+@lru_cache(maxsize=DOMAIN_CACHE_SIZE)
+def registrable_domain(host):
+    extracted = suffix_extractor()(host, include_psl_private_domains=True)
+    if extracted.domain and extracted.suffix:
+        return f"{extracted.domain}.{extracted.suffix}"
+    return None
@@ -0,0 +1,358 @@
+import re
+import json
+import time
+import importlib.util
+from functools import lru_cache
+from bs4 import BeautifulSoup, NavigableString, Tag
+from urllib.parse import unquote, urljoin, urlparse, urldefrag
+from html import unescape
+
+from .config import (IGNORE_DOMAINS, COMMON_EMAIL_DOMAINS, CONTACT_KEYWORDS, NAV_LINK_BONUS, MAX_CONTACT_PAGES,
+                     EMAIL_CACHE_SIZE)
+from .metrics import add_timing
+from .domains import get_domain
+
+# Faster lxml parser when it is installed, the standard library parser otherwise
+HTML_PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+
+# Elements with any of these in their class usually hold contact details
+EMAIL_CLASSES = ["email", "mail", "e-mail", "contact", "email-address", "mail-link", "mini-contacts",
+                 "footer-contact", "header-contact", "contact-info", "contact-details", "contact-email",
+                 "footer-email", "header-email", "info"]
+IMAGE_EXTENSIONS = [".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".ico"]
+# Ignored domains as a set, matched against an address's domain and each of its parent domains
+IGNORE_DOMAIN_SET = frozenset(IGNORE_DOMAINS)
+# A page without an "@", a mailto link or an encoded "@" cannot yield an email, so it is not parsed
+ENCODED_AT = r'&#0*64|&#[xX]0*40|&commat|\\u0040'
+ENCODED_AT_PATTERN = re.compile(ENCODED_AT)
+ENCODED_AT_PATTERN_BYTES = re.compile(ENCODED_AT.encode())
+
+# Precompiled patterns used by the extractor
+EMAIL_PATTERN = re.compile(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}")
+VALID_EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+EDGE_CHARS_PATTERN = re.compile(r'^[^a-zA-Z0-9]+|[^a-zA-Z0-9\.]+$')
+IMAGE_SIZE_PATTERN = re.compile(r'\d+x\d+')
+EMAIL_CLASS_PATTERN = re.compile("|".join(re.escape(name) for name in EMAIL_CLASSES), re.I)
+COMMON_DOMAIN_EMAIL_PATTERN = re.compile(r'[a-zA-Z0-9._%+-]+@(?:' + "|".join(re.escape(domain) for domain in COMMON_EMAIL_DOMAINS) + ')')
+# Explicit email fields in JSON, e.g. "email": "example@domain.com"
+JSON_EMAIL_KEY_PATTERN = re.compile(r'"(?:email|emailAddress|mail|e-mail|contactEmail|support_email)"\s*:\s*"([^"]+@[^"]+\.[^"]+)"')
+JSON_OBJECT_PATTERN = re.compile(r'\{[^{}]*\}')
+# String concatenation, Array.join(), reverse() and character code conversion
+OBFUSCATION_PATTERN = re.compile(r'[\'"]\s*\+\s*[\'"]|\.join\(|\.reverse\(|String\.fromCharCode')
+SCRIPT_STRING_PATTERN = re.compile(r'[\'"]([a-zA-Z0-9._%+-@]+)[\'"]')
+# Streamed chunks are only scanned up to the last of these, so an address split across two
+# chunks is scanned whole with the next one
+EMAIL_PATTERN_BYTES = re.compile(EMAIL_PATTERN.pattern.encode())
+CHUNK_DELIMITERS = [b" ", b"\n", b"<", b">", b'"', b"'"]
+MAX_CHUNK_CARRY = 256  # Bytes held back for the next chunk at most
+
+# Function to validate and clean email addresses
+def validate_email(email):
+    # Clean and validate the email format
+    email = email.strip().lower()
+    
+    # Ignore image files and other non-email strings containing @ symbol
+    if any(ext in email for ext in IMAGE_EXTENSIONS):
+        return None
+    
+    # Remove any invalid start/end characters
+    email = EDGE_CHARS_PATTERN.sub('', email)
+    
+    # Check if the email follows a valid pattern
+    if VALID_EMAIL_PATTERN.match(email):
+        # Ensure the email doesn't contain file extensions or other non-email patterns
+        parts = email.split('@')
+        if len(parts) == 2 and "." in parts[1]:
+            domain_part = parts[1]
+            # Check if the domain part looks valid (not an image or file name)
+            if not IMAGE_SIZE_PATTERN.search(domain_part):  # Pattern often found in image dimensions
+                return email
+    return None
+
+# Function to check whether a domain or any domain above it is ignored
+# (sentry.io covers o123.ingest.sentry.io but not notsentry.io)
+def is_ignored_domain(domain):
+    while domain not in IGNORE_DOMAIN_SET:
+        dot = domain.find(".")
+        if dot < 0:
+            return False
+        domain = domain[dot + 1:]
+    return True
+
+# Function to validate an email and drop it if it's from an ignored domain. The verdict is
+# remembered, so an address seen on many sites in a batch is only checked once.
+@lru_cache(maxsize=EMAIL_CACHE_SIZE)
+def clean_email(email):
+    valid_email = validate_email(email)
+    if valid_email and not is_ignored_domain(valid_email.rpartition("@")[2]):
+        return valid_email
+    return None
+
+# Function to find the usernames on one domain that contain another of its usernames
+# (like "501-3362hello" vs "hello"), keeping the shorter one (assuming it's cleaner).
+# Only substrings as long as a username that exists are looked up, shortest first.
+# Results are remembered, so a group of addresses repeated across sites is resolved once.
+@lru_cache(maxsize=EMAIL_CACHE_SIZE)
+def find_contained_usernames(usernames):
+    lengths = sorted({len(username) for username in usernames})
+    contained = set()
+    for username in usernames:
+        for length in lengths:
+            if length >= len(username):
+                break
+            if any(username[start:start + length] in usernames for start in range(len(username) - length + 1)):
+                contained.add(username)
+                break
+    return frozenset(contained)
+
+# Function to clean and deduplicate emails. Emails already cleaned by the extractor can
+# pass validated=True to skip validating them again.
+def clean_and_deduplicate_emails(emails_list, validated=False):
+    if not emails_list:
+        return []
+    
+    # First round of cleaning and deduplication
+    if validated:
+        clean_emails = set(emails_list)
+    else:
+        clean_emails = {clean_email(email) for email in emails_list} - {None}
+
+    # Handle cases where one email is contained within another, one domain at a time
+    usernames_by_domain = {}
+    for email in clean_emails:
+        username, _, domain = email.rpartition("@")
+        usernames_by_domain.setdefault(domain, set()).add(username)
+
+    final_cleaned = []
+    for domain, usernames in usernames_by_domain.items():
+        contained = find_contained_usernames(frozenset(usernames)) if len(usernames) > 1 else ()
+        final_cleaned.extend(f"{username}@{domain}" for username in usernames if username not in contained)
+    return final_cleaned
+
+# Function to check whether a page could contain an email at all, so pages without
+# an "@", a mailto link or an encoded "@" never get parsed
+def has_email_markers(content):
+    if isinstance(content, bytes):
+        return b"@" in content or b"mailto" in content or bool(ENCODED_AT_PATTERN_BYTES.search(content))
+    return "@" in content or "mailto" in content or bool(ENCODED_AT_PATTERN.search(content))
+
+# Function to find emails hidden in flat JSON objects inside a script
+def extract_json_emails(script_text):
+    found = []
+
+    # Recursively search for email keys in the JSON
+    def search(obj):
+        if isinstance(obj, dict):
+            for key, value in obj.items():
+                if isinstance(value, str) and any(k in key.lower() for k in ['email', 'mail', 'contact']):
+                    if '@' in value and '.' in value:
+                        found.append(value)
+                elif isinstance(value, (dict, list)):
+                    search(value)
+        elif isinstance(obj, list):
+            for item in obj:
+                search(item)
+
+    for json_str in JSON_OBJECT_PATTERN.findall(script_text):
+        try:
+            search(json.loads(json_str))
+        except ValueError:
+            pass
+    return found
+
+# Function to extract emails from a script tag's source
+def extract_script_emails(script_text, is_contact_page=False):
+    found = JSON_EMAIL_KEY_PATTERN.findall(script_text)
+    lowered = script_text.lower()
+    if 'mail' in lowered or 'contact' in lowered:
+        found.extend(extract_json_emails(script_text))
+
+        # Look for JavaScript email obfuscation (especially on contact pages)
+        # like 'user' + '@' + 'domain.com', Array.join(), reverse() or String.fromCharCode
+        if is_contact_page and OBFUSCATION_PATTERN.search(script_text):
+            parts = SCRIPT_STRING_PATTERN.findall(script_text)
+            reconstructed = ''.join(parts)
+            if '@' in reconstructed:
+                found.extend(EMAIL_PATTERN.findall(reconstructed))
+    return found
+
+# Function to extract emails from the HTML of a single page. One walk over the tree
+# collects every candidate: visible text, mailto links, elements with email-related
+# classes, all attributes, sole-child strings, scripts (JSON and obfuscated), meta tags
+# and hidden form fields. Common email domains are also matched against the raw HTML.
+# Pass a timings dict to have the seconds spent in each phase added to it.
+def extract_emails_from_html(html_content, is_contact_page=False, soup=None, parser=HTML_PARSER, timings=None):
+    start = time.perf_counter()
+    if soup is None:
+        if not has_email_markers(html_content):
+            return set()
+        soup = BeautifulSoup(html_content, parser)
+        start = add_timing(timings, "soup", start)
+
+    script_time = 0.0
+    candidates = set(COMMON_DOMAIN_EMAIL_PATTERN.findall(html_content))
+    text_types = soup.interesting_string_types
+    # Text collected for each open element with an email-related class, since its
+    # get_text() can join an address split across tags (info@<b>site.com</b>)
+    class_buffers = []
+
+    stack = [(soup, False)]
+    while stack:
+        node, closing = stack.pop()
+        if closing:
+            string_types, parts = class_buffers.pop()
+            element_text = ''.join(parts)
+            if '@' in element_text:
+                candidates.update(EMAIL_PATTERN.findall(element_text))
+            continue
+
+        if isinstance(node, NavigableString):
+            if '@' in node:
+                parent = node.parent
+                # Visible text, or the tag's .string when it is the only child
+                if type(node) in text_types or (parent is not soup and len(parent.contents) == 1):
+                    candidates.update(EMAIL_PATTERN.findall(node))
+            for string_types, parts in class_buffers:
+                if type(node) in string_types:
+                    parts.append(node)
+            continue
+
+        if not isinstance(node, Tag):
+            continue
+
+        for attr_name, attr_value in node.attrs.items():
+            if isinstance(attr_value, str) and "@" in attr_value:
+                candidates.update(EMAIL_PATTERN.findall(attr_value))
+
+        if node.name == "a":
+            href = node.get("href", "")
+            if isinstance(href, str) and "mailto:" in href:
+                email = href.replace("mailto:", "").split("?")[0].strip()
+                candidates.add(unquote(email))  # Handle URL encoded characters
+        elif node.name == "script" and node.string:
+            script_start = time.perf_counter()
+            candidates.update(extract_script_emails(node.string, is_contact_page))
+            script_time += time.perf_counter() - script_start
+
+        classes = node.get("class")
+        if classes and node is not soup:
+            if not isinstance(classes, str):
+                classes = " ".join(classes)
+            if EMAIL_CLASS_PATTERN.search(classes):
+                class_buffers.append((node.interesting_string_types, []))
+                stack.append((node, True))
+
+        stack.extend((child, False) for child in reversed(node.contents))
+
+    if timings is not None:
+        timings["scripts"] = timings.get("scripts", 0.0) + script_time
+    start = add_timing(timings, "walk", start + script_time)
+
+    # Clean and add valid emails to the local set
+    local_emails = clean_candidates(candidates)
+    add_timing(timings, "validate", start)
+    return local_emails
+
+# Function to validate candidate emails, dropping those from the ignore domains
+def clean_candidates(candidates):
+    return {clean_email(email) for email in candidates} - {None}
+
+# Scans a body for email candidates chunk by chunk as it downloads, so a page that is cut
+# short (too large, or the connection dropped) still yields the addresses in the part that arrived
+class ChunkScanner:
+    def __init__(self):
+        self.candidates = set()
+        self._carry = b""
+
+    def feed(self, chunk):
+        buffer = self._carry + chunk
+        end = max(buffer.rfind(delimiter) for delimiter in CHUNK_DELIMITERS) + 1
+        if end and b"@" in buffer:
+            self.candidates.update(match.decode() for match in EMAIL_PATTERN_BYTES.findall(buffer, 0, end))
+        self._carry = buffer[end:][-MAX_CHUNK_CARRY:]
+
+    # The body ended normally, so what is held back is a complete tail rather than a cut-off one
+    def finish(self):
+        if b"@" in self._carry:
+            self.candidates.update(match.decode() for match in EMAIL_PATTERN_BYTES.findall(self._carry))
+        self._carry = b""
+
+# Function to collect same-site links from a page as (url, anchor text, in nav/header/footer)
+def find_page_links(soup, page_url):
+    site_domain = get_domain(page_url)
+    # Links inside nav/header/footer, collected once rather than walking up from every link
+    nav_links = {id(a_tag) for section in soup.find_all(["nav", "header", "footer"])
+                 for a_tag in section.find_all("a", href=True)}
+    links = []
+    for a_tag in soup.find_all("a", href=True):
+        url = urldefrag(urljoin(page_url, a_tag["href"].strip()))[0]
+        if not url.startswith(("http://", "https://")) or get_domain(url) != site_domain:
+            continue
+        links.append((url, a_tag.get_text(" ", strip=True), id(a_tag) in nav_links))
+    return links
+
+# Function to pull page URLs out of a sitemap.xml body
+def find_sitemap_urls(sitemap_content):
+    return [unescape(url) for url in re.findall(r"<loc>\s*(.*?)\s*</loc>", sitemap_content, re.I | re.S)]
+
+# Function to score how likely a link is to be a contact page (0 means not at all)
+def score_contact_link(url, text="", in_nav=False):
+    path = urlparse(url).path.lower()
+    text = text.lower()
+    score = max((weight for keyword, weight in CONTACT_KEYWORDS.items() if keyword in path or keyword in text), default=0)
+    if score and in_nav:
+        score += NAV_LINK_BONUS
+    return score
+
+# Function to pick the most promising contact pages from discovered links, best first
+def rank_contact_pages(links, page_url, limit=MAX_CONTACT_PAGES):
+    site_domain = get_domain(page_url)
+    skip = {urldefrag(page_url)[0].rstrip("/")}
+    scores = {}
+    for url, text, in_nav in links:
+        key = url.rstrip("/")
+        if key in skip or get_domain(url) != site_domain:
+            continue
+        score = score_contact_link(url, text, in_nav)
+        if score and score > scores.get(key, (0, url))[0]:
+            scores[key] = (score, url)
+    # Sort by score; ties keep the order the links were found in
+    ranked = sorted(scores.values(), key=lambda item: -item[0])
+    return [url for score, url in ranked[:limit]]
+
+# Function to parse a homepage once for both its emails and its candidate contact links
+def parse_homepage(html_content, page_url, parser=HTML_PARSER, timings=None):
+    start = time.perf_counter()
+    soup = BeautifulSoup(html_content, parser)
+    add_timing(timings, "soup", start)
+    emails = extract_emails_from_html(html_content, soup=soup, timings=timings)
+    start = time.perf_counter()
+    links = find_page_links(soup, page_url)
+    add_timing(timings, "links", start)
+    return emails, links
+
+# Parser worker entry points. They take the raw response bytes so decoding also happens
+# in the worker rather than on the event loop, and return the worker's timings with the result.
+def parse_page_content(content, encoding, is_contact_page=False, parser=HTML_PARSER):
+    timings = {}
+    start = time.perf_counter()
+    html_content = content.decode(encoding or "utf-8", errors="replace")
+    add_timing(timings, "decode", start)
+    return extract_emails_from_html(html_content, is_contact_page, parser=parser, timings=timings), timings
+
+def parse_homepage_content(content, encoding, page_url, parser=HTML_PARSER):
+    timings = {}
+    start = time.perf_counter()
+    html_content = content.decode(encoding or "utf-8", errors="replace")
+    add_timing(timings, "decode", start)
+    emails, links = parse_homepage(html_content, page_url, parser, timings)
+    return emails, links, timings
+
+# Function to order a site's emails with those matching the website's domain first
+def prioritize_emails(emails, domain):
+    # Prioritize emails with domain matching the website
+    domain_emails = [email for email in emails if domain and domain in email]
+    other_emails = [email for email in emails if email not in domain_emails]
+    
+    # Sort emails with domain emails first
+    return sorted(domain_emails) + sorted(other_emails)
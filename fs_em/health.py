@@ -0,0 +1,80 @@
+import time
+import random
+import httpx
+
+from .config import (MIN_CONNECT_TIMEOUT, MIN_READ_TIMEOUT, TIMEOUT_LATENCY_FACTOR,
+                     LATENCY_SMOOTHING, BREAKER_THRESHOLD, BREAKER_RESET_AFTER, RETRY_BACKOFF, RETRY_BACKOFF_MAX)
+from .transport import DNSError
+
+# Failures that mean every request to the host will fail the same way
+UNREACHABLE_ERRORS = {"dns", "connect", "tls"}
+# Failures that only count towards the breaker when they repeat
+REPEATED_ERRORS = {"timeout", "network"}
+
+# Circuit breaker and observed latency for one host. The breaker opens (the host is skipped)
+# after an unreachable-host error or BREAKER_THRESHOLD timeouts in a row, and lets a request
+# through again once BREAKER_RESET_AFTER has passed. Timeouts follow the host's moving
+# average connect and response times, within the configured bounds.
+class HostHealth:
+    def __init__(self):
+        self.failures = 0  # Failures in a row
+        self.open_until = 0.0
+        self.connect_time = None
+        self.response_time = None
+
+    def is_open(self):
+        return time.monotonic() < self.open_until
+
+    # Record a request that got a response (whatever its status), with its network timings
+    def record_success(self, timings):
+        self.failures = 0
+        self.open_until = 0.0
+        if timings.get("connect"):
+            self.connect_time = smooth(self.connect_time, timings["connect"])
+        if timings.get("wait"):
+            self.response_time = smooth(self.response_time, timings["wait"])
+
+    # Record a failed request by its classify_error() kind
+    def record_failure(self, kind):
+        if kind in UNREACHABLE_ERRORS:
+            self.failures = max(self.failures + 1, BREAKER_THRESHOLD)
+        elif kind in REPEATED_ERRORS:
+            self.failures += 1
+        if self.failures >= BREAKER_THRESHOLD:
+            self.open_until = time.monotonic() + BREAKER_RESET_AFTER
+
+    # Timeouts for the next request: a few times the host's usual latency, or the maximums
+    # for a host that hasn't answered yet
+    def timeout(self, connect_timeout, read_timeout):
+        connect = adaptive_timeout(self.connect_time, MIN_CONNECT_TIMEOUT, connect_timeout)
+        read = adaptive_timeout(self.response_time, MIN_READ_TIMEOUT, read_timeout)
+        return httpx.Timeout(read, connect=connect, pool=read_timeout)
+
+# Function to update a moving average with a new sample
+def smooth(average, sample):
+    return sample if average is None else average + LATENCY_SMOOTHING * (sample - average)
+
+def adaptive_timeout(latency, lowest, highest):
+    if latency is None:
+        return highest
+    return min(highest, max(lowest, latency * TIMEOUT_LATENCY_FACTOR))
+
+# Function to check whether a failed request is worth retrying: the connection could not be
+# opened in time or dropped mid-response. DNS failures, refused connections, TLS errors and
+# read timeouts are not, since the same request would almost certainly fail the same way.
+def is_transient(exc):
+    if isinstance(exc, httpx.ConnectTimeout):
+        return True
+    if isinstance(exc, (httpx.ReadError, httpx.WriteError, httpx.RemoteProtocolError)):
+        return not isinstance(exc.__cause__, DNSError)
+    return False
+
+# Function to get the wait before retry number attempt (0-based): exponential backoff with
+# jitter, or the server's Retry-After when it gives one, never more than RETRY_BACKOFF_MAX
+def backoff_delay(attempt, retry_after=None):
+    try:
+        if retry_after is not None:
+            return min(RETRY_BACKOFF_MAX, max(0.0, float(retry_after)))
+    except ValueError:
+        pass  # An HTTP date; use the usual backoff
+    return min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** attempt) * random.uniform(0.5, 1.0)
@@ -0,0 +1,102 @@
+import io
+import csv
+import sys
+from urllib.parse import urlsplit
+
+from .config import DEFAULT_HEADERS, REQUEST_TIMEOUT, CONTACT_PAGES
+from .domains import registrable_domain
+
+# Column names that usually hold the website, checked when no column is given
+WEBSITE_COLUMNS = ["website", "url", "domain", "site", "web"]
+
+# Function to turn a sheet cell into a crawlable URL (None for empty cells)
+def normalize_website(website):
+    if not website or not isinstance(website, str) or not website.strip():
+        return None
+    website = website.strip()
+    # Ensure URL has proper http:// prefix
+    if not website.startswith(('http://', 'https://')):
+        website = 'https://' + website
+    return website
+
+# Paths that still name the whole site: rows for a site's homepage or contact/about page
+SITE_PATHS = {""} | {path.rstrip("/").lower() for path in CONTACT_PAGES}
+
+# Function to canonicalize a website for crawling. Returns the key rows are grouped by and the
+# URL to crawl. A row for a site's homepage or contact/about page is keyed by the registrable
+# domain (so www., bare and other subdomains of one business share it) and crawled from the
+# host's root, without query (UTM params) or fragment. Any other path stays in both, since on
+# hosts like facebook.com/<page> or sites.google.com/view/<site> the path is the business.
+def canonical_website(website):
+    website = website.strip()
+    parts = urlsplit(website if website.startswith(('http://', 'https://')) else 'https://' + website)
+    try:
+        host = parts.hostname or ""
+        port = parts.port
+    except ValueError:
+        return website, website  # Malformed port; crawl it as given
+    if not host:
+        return website, website
+    default_port = {"http": 80, "https": 443}.get(parts.scheme.lower())
+    netloc = f"[{host}]" if ":" in host else host  # IPv6 addresses keep their brackets
+    if port not in (None, default_port):
+        netloc += f":{port}"
+    base_url = f"{parts.scheme.lower()}://{netloc}"
+    if parts.path.rstrip("/").lower() not in SITE_PATHS:
+        query = f"?{parts.query}" if parts.query else ""
+        key_host = netloc[4:] if netloc.startswith("www.") else netloc  # www. and bare name the same tenant
+        return f"{key_host}{parts.path}{query}", f"{base_url}{parts.path}{query}"
+    key = registrable_domain(host) or host
+    if port not in (None, default_port):
+        key += f":{port}"
+    return key, base_url
+
+# Function to turn a Google Sheets link into its CSV export URL
+def google_sheet_csv_url(sheet_url):
+    sheet_id = sheet_url.split('/d/')[1].split('/')[0]
+    return f"https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq?tqx=out:csv"
+
+# Function to pick the website column of a CSV header
+def find_website_column(fieldnames, column=None):
+    if column:
+        if column not in fieldnames:
+            raise ValueError(f"Column {column!r} not found; available columns: {', '.join(fieldnames)}")
+        return column
+    for name in fieldnames:
+        if any(hint in name.lower() for hint in WEBSITE_COLUMNS):
+            return name
+    return fieldnames[0]
+
+# Function to read websites lazily from a CSV file, a Google Sheets link or stdin ("-").
+# Stdin is read as one URL per line unless a column is given, in which case it is CSV.
+def read_websites(source, column=None):
+    if source == "-" and not column:
+        for line in sys.stdin:
+            website = normalize_website(line)
+            if website:
+                yield website
+        return
+
+    if source == "-":
+        stream = sys.stdin
+    elif source.startswith(("http://", "https://")):
+        import httpx  # Only needed for sheet links; the app and job queue import this module too
+        csv_url = google_sheet_csv_url(source) if "/spreadsheets/d/" in source else source
+        response = httpx.get(csv_url, headers=DEFAULT_HEADERS, timeout=REQUEST_TIMEOUT, follow_redirects=True)
+        response.raise_for_status()
+        stream = io.StringIO(response.text)
+    else:
+        stream = open(source, newline="", encoding="utf-8-sig")
+
+    try:
+        reader = csv.DictReader(stream)
+        if not reader.fieldnames:
+            return
+        website_column = find_website_column(reader.fieldnames, column)
+        for row in reader:
+            website = normalize_website(row.get(website_column))
+            if website:
+                yield website
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
@@ -0,0 +1,425 @@
+import os
+import sys
+import csv
+import json
+import time
+import sqlite3
+import threading
+import subprocess
+import tempfile
+import uuid
+
+from .config import (JOBS_PATH, JOB_QUEUE, JOB_UNIT_SIZE, JOB_STALE_AFTER, JOB_MAX_ATTEMPTS, THROUGHPUT_WINDOW,
+                     RESULTS_DIR, RESULTS_BATCH_SIZE, WORKER_IDLE_EXIT)
+from .metrics import METRICS_COLUMNS, merge_summaries, metrics_row
+from .inputs import canonical_website
+
+# Persistent journal and work queue of batch jobs. A job's rows are split into work units that
+# workers lease, renew while they crawl and complete; a unit whose worker stops renewing it is
+# leased again by another. Every finished site is checkpointed with its emails, so a re-leased
+# unit or a resumed job only crawls the unfinished sites. Rows are keyed by their canonical
+# website when the job is created, so a domain is crawled once per job whichever units its rows
+# fall in. Any number of worker processes can share the SQLite file on one machine.
+class JobJournal:
+    def __init__(self, path=JOBS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Workers in other processes write to the same file, so wait for their locks rather than fail
+        self._db = sqlite3.connect(path, timeout=JOB_STALE_AFTER, check_same_thread=False)
+        self._db.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, source TEXT, settings TEXT, total INTEGER, status TEXT, error TEXT,
+                worker TEXT, created_at REAL, started_at REAL, done_at_start INTEGER, heartbeat REAL,
+                finished_at REAL, stats TEXT);
+            CREATE TABLE IF NOT EXISTS job_sites (
+                job_id TEXT, idx INTEGER, website TEXT, emails TEXT, done_at REAL, metrics TEXT, worker TEXT,
+                site_key TEXT, PRIMARY KEY (job_id, idx));
+            CREATE TABLE IF NOT EXISTS job_units (
+                job_id TEXT, unit INTEGER, first_idx INTEGER, last_idx INTEGER, status TEXT, worker TEXT,
+                lease_until REAL, attempts INTEGER DEFAULT 0, PRIMARY KEY (job_id, unit));
+            CREATE INDEX IF NOT EXISTS job_units_status ON job_units (status, lease_until);
+            CREATE TABLE IF NOT EXISTS workers (
+                id TEXT PRIMARY KEY, host TEXT, pid INTEGER, started_at REAL, heartbeat REAL, job_id TEXT,
+                unit INTEGER, stopped_at REAL);
+            CREATE TABLE IF NOT EXISTS job_workers (
+                job_id TEXT, session TEXT, worker TEXT, stats TEXT, PRIMARY KEY (job_id, session));
+        """)
+        # Journals created before per-site metrics, before sites recorded the worker that crawled
+        # them, and before rows were keyed by domain (their rows have no key and are crawled each)
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(job_sites)")]
+        for column in ["metrics", "worker", "site_key"]:
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE job_sites ADD COLUMN {column} TEXT")
+        self._db.execute("CREATE INDEX IF NOT EXISTS job_sites_key ON job_sites (job_id, site_key, idx)")
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # Add a job and split its rows into work units of unit_size rows. Unless the settings turn
+    # group_domains off, each row is keyed by its canonical website (see canonical_website).
+    def create_job(self, websites, settings, source="", unit_size=JOB_UNIT_SIZE):
+        job_id = uuid.uuid4().hex[:12]
+        group_domains = settings.get("group_domains", True)
+        rows = [(job_id, index, website, canonical_website(website)[0] if group_domains else None)
+                for index, website in enumerate(websites)]
+        with self._lock:
+            self._db.execute("INSERT INTO jobs (id, source, settings, total, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                             (job_id, source, json.dumps(settings), len(websites), "queued", time.time()))
+            self._db.executemany("INSERT INTO job_sites (job_id, idx, website, site_key) VALUES (?, ?, ?, ?)", rows)
+            self._add_units(job_id, len(websites), unit_size)
+            self._db.commit()
+        return job_id
+
+    def _add_units(self, job_id, total, unit_size):
+        unit_size = max(1, int(unit_size))
+        self._db.executemany("INSERT INTO job_units (job_id, unit, first_idx, last_idx, status) VALUES (?, ?, ?, ?, ?)",
+                             [(job_id, unit, first, min(first + unit_size, total) - 1, "pending")
+                              for unit, first in enumerate(range(0, total, unit_size))])
+
+    # Job details plus progress. A queued or running job from before work units existed is
+    # "interrupted" (resuming it splits it into units).
+    def get_job(self, job_id):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT id, source, settings, total, status, error, created_at, started_at, "
+                                   "done_at_start, heartbeat, finished_at, stats FROM jobs WHERE id = ?",
+                                   (job_id,)).fetchone()
+            if row is None:
+                return None
+            done, emails = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(json_array_length(emails)), 0) FROM job_sites "
+                "WHERE job_id = ? AND emails IS NOT NULL", (job_id,)).fetchone()
+            units, units_done, units_leased = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(status = 'done'), 0), "
+                "COALESCE(SUM(status = 'leased' AND lease_until >= ?), 0) FROM job_units WHERE job_id = ?",
+                (now, job_id)).fetchone()
+            worker_stats = [json.loads(stats) for stats, in self._db.execute(
+                "SELECT stats FROM job_workers WHERE job_id = ? AND stats IS NOT NULL", (job_id,))]
+        job = dict(zip(["id", "source", "settings", "total", "status", "error", "created_at", "started_at",
+                        "done_at_start", "heartbeat", "finished_at", "stats"], row))
+        job["settings"] = json.loads(job["settings"])
+        # Stats of jobs run before the queue were saved on the job itself
+        job["stats"] = merge_stats(worker_stats) if worker_stats else json.loads(job["stats"]) if job["stats"] else {}
+        job["done"] = done
+        job["emails"] = emails
+        job["units"] = units
+        job["units_done"] = units_done
+        job["units_leased"] = units_leased
+        if job["status"] in ("queued", "running") and not units and job["total"]:
+            job["status"] = "interrupted"
+        return job
+
+    def list_jobs(self, limit=10):
+        with self._lock:
+            ids = [row[0] for row in self._db.execute(
+                "SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()]
+        return [self.get_job(job_id) for job_id in ids]
+
+    # Put a job (back) on the queue: unfinished units become leasable again. Returns False for a
+    # job that is done or doesn't exist.
+    def queue_job(self, job_id, unit_size=JOB_UNIT_SIZE):
+        with self._lock:
+            row = self._db.execute("SELECT total FROM jobs WHERE id = ? AND status != 'done'", (job_id,)).fetchone()
+            if row is None:
+                return False
+            if not self._db.execute("SELECT 1 FROM job_units WHERE job_id = ? LIMIT 1", (job_id,)).fetchone():
+                self._add_units(job_id, row[0], unit_size)
+            self._db.execute("UPDATE job_units SET status = 'pending', worker = NULL, lease_until = NULL, attempts = 0 "
+                             "WHERE job_id = ? AND status != 'done'", (job_id,))
+            self._db.execute("UPDATE jobs SET status = 'queued', error = NULL, finished_at = NULL WHERE id = ?", (job_id,))
+            self._db.commit()
+        return True
+
+    def cancel_job(self, job_id):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status != 'done'",
+                             (time.time(), job_id))
+            self._db.commit()
+
+    # Lease the next unit of the oldest queued or running job: a pending unit, or one whose worker
+    # stopped renewing it. Returns the job's settings and the unit's unfinished sites as
+    # [(index, website)], or None when there is no work. Only the first row of each key is
+    # handed out; record_site fills in the rest. A unit whose lease expired JOB_MAX_ATTEMPTS
+    # times (e.g. a page that kills every worker that crawls it) fails its job instead.
+    def lease_unit(self, worker):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE status IN ('queued', 'running') "
+                "AND id IN (SELECT job_id FROM job_units WHERE status = 'leased' AND lease_until < ? AND attempts >= ?)",
+                (f"A work unit's worker stopped renewing its lease {JOB_MAX_ATTEMPTS} times", now, now,
+                 JOB_MAX_ATTEMPTS))
+            leased = self._db.execute(
+                "UPDATE job_units SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                "WHERE rowid = (SELECT job_units.rowid FROM job_units JOIN jobs ON jobs.id = job_units.job_id "
+                "WHERE jobs.status IN ('queued', 'running') "
+                "AND (job_units.status = 'pending' OR (job_units.status = 'leased' AND job_units.lease_until < ?)) "
+                "ORDER BY jobs.created_at, job_units.unit LIMIT 1) "
+                "RETURNING job_id, unit, first_idx, last_idx, attempts",
+                (worker, now + JOB_STALE_AFTER, now)).fetchone()
+            if leased is None:
+                self._db.commit()
+                return None
+            job_id, unit, first, last, attempts = leased
+            # The first lease starts the job's clock, for the UI's time estimate
+            self._db.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, "
+                "done_at_start = (SELECT COUNT(*) FROM job_sites WHERE job_id = ? AND emails IS NOT NULL) "
+                "WHERE id = ? AND status = 'queued'", (now, job_id, job_id))
+            settings, = self._db.execute("SELECT settings FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            sites = self._db.execute(
+                "SELECT idx, website FROM job_sites AS site WHERE job_id = ? AND idx BETWEEN ? AND ? AND emails IS NULL "
+                "AND NOT EXISTS (SELECT 1 FROM job_sites WHERE job_id = site.job_id AND site_key = site.site_key "
+                "AND idx < site.idx) ORDER BY idx", (job_id, first, last)).fetchall()
+            self._db.commit()
+        return {"job_id": job_id, "unit": unit, "attempts": attempts, "settings": json.loads(settings), "sites": sites}
+
+    # Units of queued or running jobs not done yet, including ones other workers hold
+    def open_units(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM job_units JOIN jobs ON jobs.id = job_units.job_id "
+                                    "WHERE jobs.status IN ('queued', 'running') AND job_units.status != 'done'"
+                                    ).fetchone()[0]
+
+    # Extend a lease; returns False once the unit was taken over or its job cancelled
+    def renew_lease(self, job_id, unit, worker):
+        with self._lock:
+            alive = self._db.execute(
+                "UPDATE job_units SET lease_until = ? WHERE job_id = ? AND unit = ? AND worker = ? AND status = 'leased' "
+                "AND (SELECT status FROM jobs WHERE id = ?) = 'running'",
+                (time.time() + JOB_STALE_AFTER, job_id, unit, worker, job_id)).rowcount
+            self._db.commit()
+        return alive == 1
+
+    # Mark a leased unit done, and its job once no unit is left
+    def complete_unit(self, job_id, unit, worker):
+        with self._lock:
+            self._db.execute("UPDATE job_units SET status = 'done', lease_until = NULL "
+                             "WHERE job_id = ? AND unit = ? AND worker = ? AND status = 'leased'", (job_id, unit, worker))
+            self._db.execute("UPDATE jobs SET status = 'done', finished_at = ? WHERE id = ? AND status = 'running' "
+                             "AND NOT EXISTS (SELECT 1 FROM job_units WHERE job_id = ? AND status != 'done')",
+                             (time.time(), job_id, job_id))
+            self._db.commit()
+
+    # Give a unit back after a failed crawl so it can be leased again; after JOB_MAX_ATTEMPTS
+    # failed leases the job is marked failed with the error
+    def release_unit(self, job_id, unit, worker, error=None):
+        with self._lock:
+            attempts = self._db.execute(
+                "UPDATE job_units SET status = 'pending', worker = NULL, lease_until = NULL "
+                "WHERE job_id = ? AND unit = ? AND worker = ? AND status = 'leased' RETURNING attempts",
+                (job_id, unit, worker)).fetchone()
+            if error and attempts and attempts[0] >= JOB_MAX_ATTEMPTS:
+                self._db.execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ? "
+                                 "WHERE id = ? AND status = 'running'", (error, time.time(), job_id))
+            self._db.commit()
+
+    # Add a worker to the registry shown in the UI
+    def register_worker(self, worker, host, pid):
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO workers (id, host, pid, started_at, heartbeat) VALUES (?, ?, ?, ?, ?)",
+                             (worker, host, pid, now, now))
+            self._db.commit()
+
+    # Record that a worker is alive and what it is working on (job_id None while idle)
+    def worker_heartbeat(self, worker, job_id=None, unit=None):
+        with self._lock:
+            self._db.execute("UPDATE workers SET heartbeat = ?, job_id = ?, unit = ? WHERE id = ?",
+                             (time.time(), job_id, unit, worker))
+            self._db.commit()
+
+    def stop_worker(self, worker):
+        with self._lock:
+            self._db.execute("UPDATE workers SET stopped_at = ?, job_id = NULL, unit = NULL WHERE id = ?",
+                             (time.time(), worker))
+            self._db.commit()
+
+    # Workers that sent a heartbeat recently and haven't stopped
+    def live_workers(self):
+        with self._lock:
+            rows = self._db.execute("SELECT id, host, pid, started_at, heartbeat, job_id, unit FROM workers "
+                                    "WHERE stopped_at IS NULL AND heartbeat >= ? ORDER BY started_at",
+                                    (time.time() - JOB_STALE_AFTER,)).fetchall()
+        return [dict(zip(["id", "host", "pid", "started_at", "heartbeat", "job_id", "unit"], row)) for row in rows]
+
+    # Save a worker's transport, cache and timing stats for a job. A worker that comes back to
+    # a job with a new crawl engine saves under a new session, so nothing is counted twice.
+    def save_worker_stats(self, job_id, session, worker, stats):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO job_workers (job_id, session, worker, stats) VALUES (?, ?, ?, ?)",
+                             (job_id, session, worker, json.dumps(stats)))
+            self._db.commit()
+
+    # Sites and emails each worker finished for a job, with its throughput over the last
+    # THROUGHPUT_WINDOW seconds (sites/sec)
+    def job_worker_throughput(self, job_id):
+        now = time.time()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT job_sites.worker, workers.host, workers.pid, workers.heartbeat, workers.stopped_at, "
+                "workers.job_id, workers.unit, COUNT(*), COALESCE(SUM(json_array_length(emails)), 0), "
+                "COALESCE(SUM(done_at >= ?), 0) FROM job_sites LEFT JOIN workers ON workers.id = job_sites.worker "
+                "WHERE job_sites.job_id = ? AND emails IS NOT NULL AND job_sites.worker IS NOT NULL "
+                "GROUP BY job_sites.worker ORDER BY job_sites.worker", (now - THROUGHPUT_WINDOW, job_id)).fetchall()
+        throughput = []
+        for worker, host, pid, heartbeat, stopped_at, current_job, unit, sites, emails, recent in rows:
+            alive = stopped_at is None and (heartbeat or 0) >= now - JOB_STALE_AFTER
+            throughput.append({"worker": worker, "host": host, "pid": pid, "alive": alive,
+                               "unit": unit if alive and current_job == job_id else None,
+                               "sites": sites, "emails": emails, "sites_per_sec": recent / THROUGHPUT_WINDOW})
+        return throughput
+
+    # Checkpoint one finished site, with its timing and failure metrics and the worker that crawled
+    # it. The emails are copied to the job's other unfinished rows with the same key; returns how
+    # many rows that filled in.
+    def record_site(self, job_id, index, emails, metrics=None, worker=None):
+        now = time.time()
+        with self._lock:
+            self._db.execute("UPDATE job_sites SET emails = ?, done_at = ?, metrics = COALESCE(?, metrics), "
+                             "worker = COALESCE(?, worker) WHERE job_id = ? AND idx = ?",
+                             (json.dumps(emails), now, json.dumps(metrics) if metrics else None, worker,
+                              job_id, index))
+            copied = self._db.execute(
+                "UPDATE job_sites SET emails = ?, done_at = ?, worker = COALESCE(?, worker) WHERE job_id = ? "
+                "AND emails IS NULL AND site_key = (SELECT site_key FROM job_sites WHERE job_id = ? AND idx = ?)",
+                (json.dumps(emails), now, worker, job_id, job_id, index)).rowcount
+            self._db.commit()
+        return copied
+
+    # One page of finished sites in sheet order as (website, emails), for showing results a page at a time
+    def job_results_page(self, job_id, offset, limit):
+        with self._lock:
+            rows = self._db.execute("SELECT website, emails FROM job_sites WHERE job_id = ? AND emails IS NOT NULL "
+                                    "ORDER BY idx LIMIT ? OFFSET ?", (job_id, limit, offset)).fetchall()
+        return [(website, json.loads(emails)) for website, emails in rows]
+
+    # Finished sites in sheet order as (website, emails), read batch_size rows at a time so a large
+    # job is never held in memory at once
+    def iter_job_results(self, job_id, batch_size=RESULTS_BATCH_SIZE):
+        last = -1
+        while True:
+            with self._lock:
+                rows = self._db.execute("SELECT idx, website, emails FROM job_sites WHERE job_id = ? AND idx > ? "
+                                        "AND emails IS NOT NULL ORDER BY idx LIMIT ?",
+                                        (job_id, last, batch_size)).fetchall()
+            for last, website, emails in rows:
+                yield website, json.loads(emails)
+            if len(rows) < batch_size:
+                return
+
+    # Per-site timing and failure metrics of the finished sites in sheet order, read batch_size
+    # rows at a time like iter_job_results
+    def iter_job_metrics(self, job_id, batch_size=RESULTS_BATCH_SIZE):
+        last = -1
+        while True:
+            with self._lock:
+                rows = self._db.execute("SELECT idx, metrics FROM job_sites WHERE job_id = ? AND idx > ? "
+                                        "AND metrics IS NOT NULL ORDER BY idx LIMIT ?",
+                                        (job_id, last, batch_size)).fetchall()
+            for last, metrics in rows:
+                yield json.loads(metrics)
+            if len(rows) < batch_size:
+                return
+
+    # Write a job's export file with write(f) and return its path. The file is reused until
+    # another site finishes.
+    def _export(self, job_id, path, write):
+        with self._lock:
+            last_done, = self._db.execute("SELECT MAX(done_at) FROM job_sites WHERE job_id = ?", (job_id,)).fetchone()
+        if os.path.exists(path) and os.path.getmtime(path) >= (last_done or 0):
+            return path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # A temp file of its own, since another session may be exporting the same job at once
+        with tempfile.NamedTemporaryFile("w", dir=directory, prefix=os.path.basename(path) + ".", suffix=".part",
+                                         delete=False, newline="", encoding="utf-8") as f:
+            partial = f.name
+            try:
+                write(f)
+            except BaseException:
+                f.close()
+                os.remove(partial)
+                raise
+        if last_done:
+            # Stamp the file with the newest result it holds, so results that finish during the export make it stale
+            os.utime(partial, (last_done, last_done))
+        os.replace(partial, path)
+        return path
+
+    # Write a job's finished sites to a CSV file (one row per email), row by row, and return its path
+    def export_job_csv(self, job_id, directory=RESULTS_DIR):
+        def write(f):
+            writer = csv.writer(f)
+            writer.writerow(["Website", "Email"])
+            for website, emails in self.iter_job_results(job_id):
+                writer.writerows([website, email] for email in emails or [""])
+        return self._export(job_id, os.path.join(directory, f"{job_id}.csv"), write)
+
+    # Write a job's per-site timing and failure metrics to a CSV (one row per site, requests left
+    # out) or JSON file, site by site, and return its path
+    def export_job_metrics(self, job_id, fmt="csv", directory=RESULTS_DIR):
+        def write_csv(f):
+            writer = csv.DictWriter(f, METRICS_COLUMNS)
+            writer.writeheader()
+            writer.writerows(map(metrics_row, self.iter_job_metrics(job_id)))
+
+        def write_json(f):
+            f.write("[")
+            for count, metrics in enumerate(self.iter_job_metrics(job_id)):
+                f.write(",\n" if count else "\n")
+                f.write(json.dumps(metrics))
+            f.write("\n]\n")
+        return self._export(job_id, os.path.join(directory, f"{job_id}-timing.{fmt}"),
+                            write_json if fmt == "json" else write_csv)
+
+# Function to add up the stats several workers saved for a job: counters are summed and the
+# timing summaries merged
+def merge_stats(stats_list):
+    merged = {}
+    for stats in stats_list:
+        for key, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                merged[key] = merged.get(key, 0) + value
+    if "requests" in merged:
+        merged["reuse_ratio"] = merged.get("pool_hits", 0) / merged["requests"] if merged["requests"] else 0.0
+    timings = [stats["timing"] for stats in stats_list if stats.get("timing")]
+    if timings:
+        merged["timing"] = merge_summaries(timings)
+    return merged
+
+# Job queue backends by URL scheme. A backend is a class with JobJournal's methods, built from
+# the part of the location after "scheme://".
+QUEUE_BACKENDS = {"sqlite": JobJournal}
+
+# Function to open the job queue at a location: a SQLite file path, "sqlite:///path", or
+# "<scheme>://..." for a backend added to QUEUE_BACKENDS
+def open_journal(location=None):
+    location = location or JOB_QUEUE
+    scheme, separator, rest = location.partition("://")
+    if not separator:
+        return JobJournal(location)
+    if scheme not in QUEUE_BACKENDS:
+        raise ValueError(f"no job queue backend for {scheme}://")
+    return QUEUE_BACKENDS[scheme](rest)
+
+# Function to put a job on the queue for the workers; returns False for a finished or unknown job
+def start_job(job_id, location=None):
+    journal = open_journal(location)
+    try:
+        return journal.queue_job(job_id)
+    finally:
+        journal.close()
+
+# Function to start a worker (python -m fs_em.worker) in its own process, detached from the
+# caller (e.g. the Streamlit app), that exits after exit_when_idle seconds without work.
+# Returns the process.
+def spawn_worker(location=None, exit_when_idle=WORKER_IDLE_EXIT):
+    command = [sys.executable, "-m", "fs_em.worker", "--queue", location or JOB_QUEUE,
+               "--exit-when-idle", str(exit_when_idle), "--quiet"]
+    return subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL, start_new_session=True)
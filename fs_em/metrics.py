@@ -0,0 +1,252 @@
+import ssl
+import time
+import cProfile
+import contextvars
+import importlib.util
+
+from .config import SLOWEST_SITES
+
+# Timing phases in the order they are reported: network phases per request, then parse phases
+# (reported by the parser workers), then work done on the event loop. fetch_wait is time spent
+# waiting for a global or per-host request slot, parse_wait time spent waiting for a parser.
+NETWORK_PHASES = ["fetch_wait", "dns", "connect", "tls", "send", "wait", "download"]
+PARSE_PHASES = ["parse_wait", "decode", "soup", "walk", "scripts", "validate", "links"]
+SITE_PHASES = ["cache", "dedupe"]
+PHASES = NETWORK_PHASES + PARSE_PHASES + SITE_PHASES
+# httpcore trace events (e.g. "http11.receive_response_body.complete") to timing phases
+TRACE_PHASES = {"connect_tcp": "connect", "start_tls": "tls", "send_request_headers": "send",
+                "send_request_body": "send", "receive_response_headers": "wait", "receive_response_body": "download"}
+PYINSTRUMENT_AVAILABLE = importlib.util.find_spec("pyinstrument") is not None
+
+# Timer of the request being sent on the current task, so the DNS resolver can report to it
+current_request = contextvars.ContextVar("current_request", default=None)
+
+# Raised instead of sending a request to a host the circuit breaker has cut off
+class CircuitOpenError(Exception):
+    pass
+
+# Function to add the time since start to a timings dict (if there is one); returns the current clock
+def add_timing(timings, phase, start):
+    now = time.perf_counter()
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0.0) + now - start
+    return now
+
+# Function to sort a failed fetch or parse into timeout, pool_timeout, dns, tls, connect, redirects,
+# network, circuit_open or error. httpx is imported here rather than at the top so parser workers,
+# which only use add_timing, don't load it.
+def classify_error(exc):
+    import httpx
+    from .transport import DNSError
+    if isinstance(exc, httpx.PoolTimeout):
+        return "pool_timeout"  # Waited too long for a free connection; says nothing about the host
+    if isinstance(exc, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(exc, CircuitOpenError):
+        return "circuit_open"
+    chain = []
+    while exc is not None and exc not in chain:
+        chain.append(exc)
+        exc = exc.__cause__ or exc.__context__
+    if any(isinstance(error, DNSError) for error in chain):
+        return "dns"
+    if any(isinstance(error, ssl.SSLError) or "SSL" in str(error) or "CERTIFICATE" in str(error) for error in chain):
+        return "tls"
+    if isinstance(chain[0], httpx.ConnectError):
+        return "connect"
+    if isinstance(chain[0], httpx.TooManyRedirects):
+        return "redirects"
+    if isinstance(chain[0], httpx.HTTPError):
+        return "network"
+    return "error"
+
+# Collects the network phases of one request (including its redirects) from httpcore's trace extension
+class RequestTimer:
+    def __init__(self):
+        self.timings = {}
+        self._started = {}
+
+    async def trace(self, event_name, info):
+        prefix, name, state = event_name.rsplit(".", 2)
+        phase = TRACE_PHASES.get(name)
+        if phase is None:
+            return
+        if state == "started":
+            self._started[name] = time.perf_counter()
+        elif name in self._started:
+            add_timing(self.timings, phase, self._started.pop(name))
+
+    def add(self, phase, seconds):
+        self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+    # Network phases with DNS time taken out of the TCP connect it happened in
+    def result(self):
+        timings = dict(self.timings)
+        if "dns" in timings and "connect" in timings:
+            timings["connect"] = max(0.0, timings["connect"] - timings["dns"])
+        return timings
+
+# Timing and failures for one website: every request it made, its parse phases and why anything failed
+class SiteMetrics:
+    def __init__(self, website):
+        self.website = website
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self.cached = False  # Result came from the crawl cache
+        self.emails = 0
+        self.error = None  # Why the homepage could not be crawled, if it couldn't
+        self.timings = {}
+        self.failures = {}
+        self.requests = []
+
+    def add_timings(self, timings):
+        for phase, seconds in timings.items():
+            self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+    def add_failure(self, kind):
+        self.failures[kind] = self.failures.get(kind, 0) + 1
+
+    # Record one fetch; a response with a 4xx/5xx status counts as an "http_<status>" failure
+    def add_request(self, url, role, response=None, timings=None, error=None, seconds=0.0):
+        status = response.status_code if response is not None else None
+        if error is None and status is not None and status >= 400:
+            error = f"http_{status}"
+        if error:
+            self.add_failure(error)
+        if timings:
+            self.add_timings(timings)
+        self.requests.append({"url": url, "role": role, "status": status, "error": error, "seconds": round(seconds, 4),
+                              "bytes": len(response.content) if response is not None else 0})
+        if role == "homepage" and error:
+            self.error = error
+
+    def finish(self, emails):
+        self.seconds = time.perf_counter() - self.started
+        self.emails = len(emails)
+
+    def to_dict(self):
+        return {"website": self.website, "seconds": round(self.seconds, 4), "cached": self.cached,
+                "emails": self.emails, "error": self.error, "pages": len(self.requests),
+                "bytes": sum(request["bytes"] for request in self.requests),
+                "timings": {phase: round(seconds, 4) for phase, seconds in self.timings.items()},
+                "failures": dict(self.failures), "requests": self.requests}
+
+# Function to flatten a site's metrics into one CSV row (requests are left out)
+def metrics_row(metrics):
+    row = {key: metrics[key] for key in ["website", "seconds", "cached", "emails", "error", "pages", "bytes"]}
+    for phase in PHASES:
+        row[phase] = metrics["timings"].get(phase, 0.0)
+    row["failures"] = ";".join(f"{kind}={count}" for kind, count in sorted(metrics["failures"].items()))
+    return row
+
+METRICS_COLUMNS = ["website", "seconds", "cached", "emails", "error", "pages", "bytes"] + PHASES + ["failures"]
+
+# Running totals over every site crawled: time per phase, failure counts and the slowest sites
+class MetricsSummary:
+    def __init__(self):
+        self.sites = 0
+        self.cached = 0
+        self.seconds = 0.0
+        self.timings = {}
+        self.failures = {}
+        self.site_errors = {}
+        self.slowest = []  # (seconds, website), longest first
+        self.duplicates = 0  # Rows answered from another row's crawl of the same domain
+        self.fetches_saved = 0  # Pages those rows would have fetched
+
+    def add(self, site):
+        self.sites += 1
+        self.cached += site.cached
+        self.seconds += site.seconds
+        for phase, seconds in site.timings.items():
+            self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+        for kind, count in site.failures.items():
+            self.failures[kind] = self.failures.get(kind, 0) + count
+        if site.error:
+            self.site_errors[site.error] = self.site_errors.get(site.error, 0) + 1
+        if len(self.slowest) < SLOWEST_SITES or site.seconds > self.slowest[-1][0]:
+            self.slowest = sorted(self.slowest + [(site.seconds, site.website)], reverse=True)[:SLOWEST_SITES]
+
+    # Record a row that reused the result of a crawl that fetched `pages` pages
+    def add_duplicate(self, pages):
+        self.duplicates += 1
+        self.fetches_saved += pages
+
+    def summary(self):
+        return {"sites": self.sites, "cached": self.cached, "seconds": round(self.seconds, 3),
+                "duplicates": self.duplicates, "fetches_saved": self.fetches_saved,
+                "timings": {phase: round(self.timings[phase], 3) for phase in PHASES if phase in self.timings},
+                "failures": dict(sorted(self.failures.items(), key=lambda item: -item[1])),
+                "site_errors": dict(sorted(self.site_errors.items(), key=lambda item: -item[1])),
+                "slowest": [[website, round(seconds, 3)] for seconds, website in self.slowest]}
+
+# Function to combine MetricsSummary.summary() results from several crawl engines (e.g. workers)
+def merge_summaries(summaries):
+    merged = {"sites": 0, "cached": 0, "seconds": 0.0, "duplicates": 0, "fetches_saved": 0,
+              "timings": {}, "failures": {}, "site_errors": {}, "slowest": []}
+    for summary in summaries:
+        for key in ["sites", "cached", "seconds", "duplicates", "fetches_saved"]:
+            merged[key] += summary.get(key, 0)
+        for key in ["timings", "failures", "site_errors"]:
+            for name, value in summary[key].items():
+                merged[key][name] = merged[key].get(name, 0) + value
+        merged["slowest"] += summary["slowest"]
+    merged["seconds"] = round(merged["seconds"], 3)
+    merged["timings"] = {phase: round(merged["timings"][phase], 3) for phase in PHASES if phase in merged["timings"]}
+    merged["failures"] = dict(sorted(merged["failures"].items(), key=lambda item: -item[1]))
+    merged["site_errors"] = dict(sorted(merged["site_errors"].items(), key=lambda item: -item[1]))
+    merged["slowest"] = sorted(merged["slowest"], key=lambda item: -item[1])[:SLOWEST_SITES]
+    return merged
+
+# Function to render a MetricsSummary.summary() as a short text report
+def format_breakdown(summary):
+    lines = [f"Sites: {summary['sites']} ({summary['cached']} from cache) | Site time: {summary['seconds']:.1f}s"]
+    if summary.get("duplicates"):
+        lines.append(f"Duplicate rows: {summary['duplicates']} (fetches saved: {summary['fetches_saved']})")
+    total = sum(summary["timings"].values()) or 1.0
+    for phase, seconds in summary["timings"].items():
+        lines.append(f"  {phase:<11}{seconds:10.2f}s {seconds / total:6.1%}")
+    if summary["failures"]:
+        lines.append("Failures: " + ", ".join(f"{kind} {count}" for kind, count in summary["failures"].items()))
+    if summary["site_errors"]:
+        lines.append("Sites failed: " + ", ".join(f"{kind} {count}" for kind, count in summary["site_errors"].items()))
+    if summary["slowest"]:
+        lines.append("Slowest: " + ", ".join(f"{website} ({seconds:.1f}s)" for website, seconds in summary["slowest"]))
+    return "\n".join(lines)
+
+# cProfile behind the same start()/stop() interface as pyinstrument's sampling Profiler
+class CProfileProfiler:
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def write(self, path):
+        self.profile.dump_stats(path)
+
+# pyinstrument's sampling profiler, writing HTML for .html paths and text otherwise
+class SamplingProfiler:
+    def __init__(self):
+        from pyinstrument import Profiler
+        self.profiler = Profiler(async_mode="enabled")
+
+    def start(self):
+        self.profiler.start()
+
+    def stop(self):
+        self.profiler.stop()
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.profiler.output_html() if path.endswith(".html") else self.profiler.output_text())
+
+# Function to make a profiler for CrawlEngine(profiler=...): pyinstrument's sampling
+# profiler when it is installed, cProfile otherwise
+def make_profiler(kind="auto"):
+    if kind == "pyinstrument" or (kind == "auto" and PYINSTRUMENT_AVAILABLE):
+        return SamplingProfiler()
+    return CProfileProfiler()
@@ -0,0 +1,156 @@
+import asyncio
+import socket
+import ipaddress
+import time
+import httpx
+import httpcore
+
+from .config import (POOL_MAX_CONNECTIONS, POOL_MAX_KEEPALIVE, KEEPALIVE_EXPIRY, DNS_CACHE_TTL, DNS_FAILURE_TTL,
+                     HTTP2_AVAILABLE, MAX_PAGE_BYTES, PAGE_CONTENT_TYPES)
+from .metrics import current_request
+from .extract import ChunkScanner
+
+# Raised by the resolver when a host does not resolve, so DNS failures can be told apart from refused connections
+class DNSError(httpcore.ConnectError):
+    pass
+
+# Network backend that resolves each host once and reuses the address for later connections.
+# Hosts in overrides ({hostname: address}) are never looked up, like curl --resolve.
+class CachingResolverBackend(httpcore.AsyncNetworkBackend):
+    def __init__(self, backend, ttl=DNS_CACHE_TTL, stats=None, overrides=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.stats = stats if stats is not None else {}
+        self.overrides = overrides or {}
+        self._cache = {}  # (host, port) -> (expires at, addresses or the lookup error)
+        self._pending = {}  # (host, port) -> future for a lookup already in flight
+
+    async def resolve(self, host, port):
+        if host in self.overrides:
+            return [self.overrides[host]]
+        key = (host, port)
+        start = time.perf_counter()
+        cached = self._cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            self.stats["dns_cache_hits"] = self.stats.get("dns_cache_hits", 0) + 1
+        else:
+            # Concurrent connections to a new host share a single lookup
+            if key not in self._pending:
+                self._pending[key] = asyncio.ensure_future(self._lookup(host, port))
+            try:
+                await asyncio.shield(self._pending[key])
+            finally:
+                self._pending.pop(key, None)
+            cached = self._cache[key]
+        timer = current_request.get()
+        if timer is not None:
+            timer.add("dns", time.perf_counter() - start)
+        if isinstance(cached[1], Exception):
+            raise DNSError(str(cached[1]))
+        return cached[1]
+
+    async def _lookup(self, host, port):
+        self.stats["dns_lookups"] = self.stats.get("dns_lookups", 0) + 1
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+            addresses = list(dict.fromkeys(info[4][0] for info in infos))
+            self._cache[(host, port)] = (time.monotonic() + self.ttl, addresses)
+        except (OSError, UnicodeError) as exc:
+            # Failed lookups are remembered briefly so a dead domain is not resolved over and over
+            self._cache[(host, port)] = (time.monotonic() + min(self.ttl, DNS_FAILURE_TTL), exc)
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        self.stats["connections_opened"] = self.stats.get("connections_opened", 0) + 1
+        try:
+            ipaddress.ip_address(host)
+            addresses = [host]
+        except ValueError:
+            addresses = await self.resolve(host, port)
+        # TLS still verifies against the hostname; only the TCP connect uses the cached address
+        for address in addresses[:-1]:
+            try:
+                return await self.backend.connect_tcp(address, port, timeout, local_address, socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout):
+                continue
+        return await self.backend.connect_tcp(addresses[-1], port, timeout, local_address, socket_options)
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self.backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds):
+        await self.backend.sleep(seconds)
+
+# Shared HTTP transport: keep-alive connection pool, cached DNS and optional HTTP/2,
+# with counters for how often pooled connections are reused
+class PooledTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, http2=HTTP2_AVAILABLE, max_connections=POOL_MAX_CONNECTIONS,
+                 max_keepalive=POOL_MAX_KEEPALIVE, keepalive_expiry=KEEPALIVE_EXPIRY, dns_ttl=DNS_CACHE_TTL,
+                 resolve=None):
+        http2 = http2 and HTTP2_AVAILABLE
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                              keepalive_expiry=keepalive_expiry)
+        super().__init__(http2=http2, limits=limits)
+        self.http2 = http2
+        self.stats = {"requests": 0, "connections_opened": 0, "dns_lookups": 0, "dns_cache_hits": 0,
+                      "http2_responses": 0, "bytes_downloaded": 0, "bytes_decoded": 0}
+        # httpx has no option for the network backend, so wrap the one its pool already uses
+        self._pool._network_backend = CachingResolverBackend(self._pool._network_backend, dns_ttl, self.stats,
+                                                             overrides=resolve)
+
+    async def handle_async_request(self, request):
+        self.stats["requests"] += 1
+        return await super().handle_async_request(request)
+
+    # Record a response once its body has been read
+    def record_response(self, response):
+        if response.http_version == "HTTP/2":
+            self.stats["http2_responses"] += 1
+        self.stats["bytes_downloaded"] += response.num_bytes_downloaded
+        self.stats["bytes_decoded"] += len(response.content)
+
+    # Pool statistics: every request that did not open a connection was a pool hit
+    def summary(self):
+        stats = dict(self.stats)
+        stats["pool_hits"] = max(0, stats["requests"] - stats["connections_opened"])
+        stats["reuse_ratio"] = stats["pool_hits"] / stats["requests"] if stats["requests"] else 0.0
+        return stats
+
+# Function to check whether a response's Content-Type could be a page (a missing one could)
+def is_page_content_type(response):
+    content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+    return not content_type or content_type in PAGE_CONTENT_TYPES
+
+# Function to read a streamed response's body into response.content, stopping early where
+# it can: content types that can't be a page are closed unread, reading stops at max_bytes,
+# and a connection that drops mid-body keeps what arrived. Chunks are scanned for email
+# candidates as they come in. Returns why the body was cut short (None, "content_type",
+# "too_large" or "partial_body") and the candidates found.
+async def read_body(response, max_bytes=MAX_PAGE_BYTES):
+    scanner = ChunkScanner()
+    chunks = []
+    size = 0
+    cut = None
+    try:
+        if not is_page_content_type(response):
+            cut = "content_type"
+        else:
+            # Chunks as they arrive: a fixed chunk size would hold back data a dropped connection then loses
+            async for chunk in response.aiter_bytes():
+                chunk = chunk[:max_bytes - size]
+                chunks.append(chunk)
+                size += len(chunk)
+                scanner.feed(chunk)
+                if size >= max_bytes:
+                    cut = "too_large"
+                    break
+            else:
+                scanner.finish()
+    except httpx.TransportError:
+        if not chunks:
+            raise
+        cut = "partial_body"
+    finally:
+        await response.aclose()
+    # httpx only fills in content by reading the whole stream, so set what was kept directly
+    response._content = b"".join(chunks)
+    return cut, scanner.candidates
@@ -0,0 +1,176 @@
+import os
+import sys
+import time
+import uuid
+import signal
+import socket
+import asyncio
+import argparse
+
+from .config import JOB_QUEUE, JOB_HEARTBEAT_INTERVAL, JOB_POLL_INTERVAL
+from .cache import CrawlCache
+from .crawler import CrawlEngine
+from .jobs import open_journal
+
+# A queue worker: leases work units, crawls their unfinished sites and checkpoints each result,
+# renewing the lease while it works. One crawl engine is kept per job, so consecutive units of
+# a job reuse its connections, DNS cache and parser processes.
+class Worker:
+    def __init__(self, journal, worker_id=None, quiet=False):
+        self.journal = journal
+        self.id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:4]}"
+        self.quiet = quiet
+        self.cache = None
+        self.engine = None
+        self.engine_job = None
+        self.session = None
+        self.site_metrics = {}  # Metrics of finished sites until their result is checkpointed
+        self._cache_base = {}  # Cache counters when the engine was opened, so each job gets its own
+
+    # Work until cancelled, or until there has been no work for exit_when_idle seconds. Units other
+    # workers hold count as work, since their leases may expire and need taking over.
+    async def run(self, exit_when_idle=None, poll_interval=JOB_POLL_INTERVAL):
+        idle_since = time.monotonic()
+        try:
+            while True:
+                unit = self.journal.lease_unit(self.id)
+                if unit is None:
+                    # Let the parser processes and connections go while there is nothing to do
+                    await self.close_engine()
+                    self.journal.worker_heartbeat(self.id)
+                    if self.journal.open_units():
+                        idle_since = time.monotonic()
+                    elif exit_when_idle is not None and time.monotonic() - idle_since >= exit_when_idle:
+                        return
+                    await asyncio.sleep(poll_interval)
+                    continue
+                try:
+                    await self.run_unit(unit)
+                except Exception as exc:
+                    self.log(f"unit {unit['unit']} of job {unit['job_id']} failed: {exc}")
+                    self.journal.release_unit(unit["job_id"], unit["unit"], self.id, error=str(exc))
+                    await self.close_engine()
+                idle_since = time.monotonic()
+        finally:
+            await self.close_engine()
+            if self.cache:
+                self.cache.close()
+
+    async def open_engine(self, job_id, settings):
+        await self.close_engine()
+        settings = dict(settings)
+        if settings.pop("use_cache", True):
+            self.cache = self.cache or CrawlCache()
+            self._cache_base = dict(self.cache.stats)
+            cache = self.cache
+        else:
+            cache = None
+        self.engine = CrawlEngine(cache=cache, on_metrics=self.on_metrics, **settings)
+        await self.engine.__aenter__()
+        self.engine_job = job_id
+        self.session = f"{self.id}-{uuid.uuid4().hex[:6]}"
+
+    async def close_engine(self):
+        if self.engine is not None:
+            engine, self.engine, self.engine_job = self.engine, None, None
+            await engine.__aexit__(None, None, None)
+
+    def on_metrics(self, index, website, metrics):
+        self.site_metrics[index] = metrics
+
+    # Transport, cache and timing stats of the current job's engine
+    def stats(self):
+        current = self.engine.transport_stats()
+        if self.engine.cache:
+            current.update({key: value - self._cache_base.get(key, 0) for key, value in self.cache.stats.items()})
+        current["timing"] = self.engine.metrics_summary()
+        return current
+
+    # Crawl one leased unit and mark it done. The crawl is cancelled if the lease is lost (the
+    # job was cancelled or another worker took the unit over); if the worker itself is stopped,
+    # the unit is handed back for another worker.
+    async def run_unit(self, unit):
+        job_id, number, sites = unit["job_id"], unit["unit"], unit["sites"]
+        if job_id != self.engine_job:
+            await self.open_engine(job_id, unit["settings"])
+        self.site_metrics.clear()
+        self.journal.worker_heartbeat(self.id, job_id, number)
+
+        def on_result(index, website, emails):
+            metrics = self.site_metrics.pop(index, None)
+            copied = self.journal.record_site(job_id, sites[index][0], emails, metrics, self.id)
+            # Rows of other units that share the domain count as duplicates of this crawl
+            for _ in range(copied):
+                self.engine.metrics.add_duplicate(metrics["pages"] if metrics else 0)
+
+        crawl = asyncio.create_task(self.engine.crawl([website for index, website in sites], on_result=on_result))
+        try:
+            while not crawl.done():
+                await asyncio.wait([crawl], timeout=JOB_HEARTBEAT_INTERVAL)
+                if crawl.done():
+                    break
+                self.journal.worker_heartbeat(self.id, job_id, number)
+                self.journal.save_worker_stats(job_id, self.session, self.id, self.stats())
+                if not self.journal.renew_lease(job_id, number, self.id):
+                    crawl.cancel()
+        except asyncio.CancelledError:
+            crawl.cancel()
+            self.journal.release_unit(job_id, number, self.id)
+            raise
+        self.journal.save_worker_stats(job_id, self.session, self.id, self.stats())
+        if crawl.cancelled():
+            # A no-op when another worker has taken the unit over
+            self.journal.release_unit(job_id, number, self.id)
+            self.log(f"unit {number} of job {job_id} stopped: lease lost")
+            return
+        crawl.result()
+        self.journal.complete_unit(job_id, number, self.id)
+        self.log(f"unit {number} of job {job_id} done: {len(sites)} sites")
+
+    def log(self, message):
+        if not self.quiet:
+            print(f"[{self.id}] {message}", file=sys.stderr, flush=True)
+
+# Function to run a worker on the job queue at location until it is stopped (SIGINT/SIGTERM)
+# or has been idle for exit_when_idle seconds
+def run_worker(location=None, worker_id=None, exit_when_idle=None, quiet=False):
+    journal = open_journal(location)
+    worker = Worker(journal, worker_id, quiet)
+    journal.register_worker(worker.id, socket.gethostname(), os.getpid())
+
+    async def run():
+        task = asyncio.current_task()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+        except (NotImplementedError, RuntimeError):
+            pass  # No signal handlers on this platform; SIGTERM ends the process without handing units back
+        await worker.run(exit_when_idle)
+
+    try:
+        asyncio.run(run())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        journal.stop_worker(worker.id)
+        journal.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m fs_em.worker",
+                                     description="Crawl work units from the job queue until stopped.")
+    parser.add_argument("--queue", default=JOB_QUEUE,
+                        help="job queue: a SQLite journal path or backend URL (default: $FS_EM_JOB_QUEUE or "
+                             f"{JOB_QUEUE})")
+    parser.add_argument("--name", help="worker name shown in the UI (default: host-pid-random)")
+    parser.add_argument("--exit-when-idle", type=float, metavar="SECONDS",
+                        help="exit after this long without work (default: keep waiting)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="don't log units on stderr")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    run_worker(args.queue, args.name, args.exit_when_idle, args.quiet)
+    return 0
+
+# Guarded so parser processes, which re-import the main module, don't start another worker
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+import httpx
+import pytest
+
+from fs_em import cache as cache_module
+from fs_em.cache import CrawlCache, result_key
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "cache.sqlite3")
+
+
+def page(url, body=b"<p>hi@acme.com</p>", status=200):
+    return httpx.Response(status, content=body, headers={"content-type": "text/html"},
+                          request=httpx.Request("GET", url))
+
+
+@pytest.mark.parametrize("website, expected", [
+    ("https://www.Acme.com/", "acme.com"),
+    ("acme.com", "acme.com"),
+    ("https://facebook.com/bobsbakery/", "facebook.com/bobsbakery"),
+    ("https://sites.google.com/view/acme?authuser=0", "sites.google.com/view/acme?authuser=0"),
+])
+def test_result_key(website, expected):
+    assert result_key(website) == expected
+
+
+def test_tenants_of_one_host_keep_their_own_results(cache_path):
+    cache = CrawlCache(cache_path)
+    cache.store_result(result_key("https://facebook.com/bobsbakery"), ["bob@bob.com"])
+    assert cache.get_result(result_key("https://facebook.com/acme")) is None
+    assert cache.get_result(result_key("https://www.facebook.com/bobsbakery")) == ["bob@bob.com"]
+    cache.close()
+
+
+def test_page_hits_leave_the_file_writable_for_other_workers(monkeypatch, cache_path):
+    monkeypatch.setattr(cache_module, "CACHE_LOCK_TIMEOUT", 0.1)
+    first = CrawlCache(cache_path)
+    second = CrawlCache(cache_path)
+    first.store_page("https://acme.com/", page("https://acme.com/"))
+    assert first.get_page("https://acme.com/")["fresh"]
+    second.store_page("https://other.com/", page("https://other.com/"))
+    second.store_result("other.com", [])
+    second.purge()
+    first.close()
+    second.close()
+
+
+def test_retried_statuses_are_not_stored(cache_path):
+    cache = CrawlCache(cache_path)
+    cache.store_page("https://acme.com/", page("https://acme.com/", b"slow down", 429))
+    assert cache.get_page("https://acme.com/") is None
+    cache.close()
@@ -0,0 +1,41 @@
+import random
+
+from fs_em.extract import clean_and_deduplicate_emails, clean_email, find_contained_usernames, is_ignored_domain
+
+
+# The pairwise check find_contained_usernames replaced: a username is dropped when another
+# username on the same domain is a substring of it
+def contained_pairwise(usernames):
+    return {username for username in usernames
+            if any(other != username and other in username for other in usernames)}
+
+
+def test_contained_usernames_keep_the_shorter_one():
+    assert find_contained_usernames(frozenset({"hello", "501-3362hello", "info"})) == {"501-3362hello"}
+
+
+def test_contained_usernames_match_the_pairwise_check():
+    rng = random.Random(13)
+    for _ in range(500):
+        usernames = frozenset("".join(rng.choice("ab") for _ in range(rng.randint(1, 6)))
+                              for _ in range(rng.randint(2, 12)))
+        assert find_contained_usernames(usernames) == contained_pairwise(usernames)
+
+
+def test_dedupe_compares_usernames_within_a_domain_only():
+    emails = ["hello@a.com", "501-3362hello@a.com", "info@a.com", "501-3362hello@b.com"]
+    assert sorted(clean_and_deduplicate_emails(emails)) == ["501-3362hello@b.com", "hello@a.com", "info@a.com"]
+
+
+def test_ignored_domains_cover_subdomains():
+    assert is_ignored_domain("sentry.io")
+    assert is_ignored_domain("o123.ingest.sentry.io")
+    assert not is_ignored_domain("notsentry.io")
+    assert not is_ignored_domain("io")
+
+
+def test_ignored_domains_match_whole_labels():
+    # domain.com is ignored, but info@mydomain.com used to be dropped for containing it
+    assert clean_email("info@mydomain.com") == "info@mydomain.com"
+    assert clean_email("me@wix.com") is None
+    assert clean_email("x@o123.ingest.sentry.io") is None
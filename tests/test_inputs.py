@@ -0,0 +1,33 @@
+import pytest
+
+from fs_em.inputs import canonical_website
+
+
+@pytest.mark.parametrize("website, expected", [
+    # Homepage and contact/about rows are keyed by the registrable domain, crawled from the root
+    ("acme.com", ("acme.com", "https://acme.com")),
+    ("www.Acme.com/about?utm=1", ("acme.com", "https://www.acme.com")),
+    ("https://acme.com/contact-us/#team", ("acme.com", "https://acme.com")),
+    ("shop.acme.co.uk", ("acme.co.uk", "https://shop.acme.co.uk")),
+    # Hosting platforms on the public suffix list keep each site apart
+    ("foo.github.io", ("foo.github.io", "https://foo.github.io")),
+    # Any other path names the business, so it stays in the key and the URL
+    ("facebook.com/bobsbakery", ("facebook.com/bobsbakery", "https://facebook.com/bobsbakery")),
+    ("sites.google.com/view/acme?x=1", ("sites.google.com/view/acme?x=1", "https://sites.google.com/view/acme?x=1")),
+    # Ports other than the scheme's default stay; IPv6 hosts keep their brackets in the URL
+    ("http://acme.com:8080/", ("acme.com:8080", "http://acme.com:8080")),
+    ("https://acme.com:443/", ("acme.com", "https://acme.com")),
+    ("https://[::1]/", ("::1", "https://[::1]")),
+    ("http://[::1]:8080/contact", ("::1:8080", "http://[::1]:8080")),
+    ("http://192.168.1.5/contact", ("192.168.1.5", "http://192.168.1.5")),
+    # A malformed port can't be canonicalized; the row is crawled as given
+    ("acme.com:abc", ("acme.com:abc", "acme.com:abc")),
+])
+def test_canonical_website(website, expected):
+    assert canonical_website(website) == expected
+
+
+def test_tenants_are_keyed_by_page_with_or_without_www():
+    keys = [canonical_website(website)[0] for website in
+            ["facebook.com/bobsbakery", "facebook.com/acmeplumbing", "https://www.facebook.com/bobsbakery"]]
+    assert keys == ["facebook.com/bobsbakery", "facebook.com/acmeplumbing", "facebook.com/bobsbakery"]
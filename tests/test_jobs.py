@@ -0,0 +1,100 @@
+import threading
+
+import pytest
+
+from fs_em import jobs
+from fs_em.config import JOB_MAX_ATTEMPTS
+from fs_em.jobs import JobJournal
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = JobJournal(str(tmp_path / "jobs.sqlite3"))
+    yield journal
+    journal.close()
+
+
+def test_leases_never_return_the_same_unit(journal):
+    job_id = journal.create_job([f"https://site{i}.com" for i in range(40)], {}, unit_size=2)
+    leased = []
+
+    # Each worker has its own connection, as separate processes would
+    def work(worker):
+        own = JobJournal(journal.path)
+        while True:
+            unit = own.lease_unit(worker)
+            if unit is None:
+                break
+            leased.append((unit["job_id"], unit["unit"]))
+        own.close()
+
+    threads = [threading.Thread(target=work, args=(f"w{n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(leased) == [(job_id, unit) for unit in range(20)]
+
+
+def test_a_live_lease_is_only_renewed_by_its_worker(journal):
+    job_id = journal.create_job(["https://a.com", "https://b.com"], {}, unit_size=1)
+    unit = journal.lease_unit("a")
+    assert journal.renew_lease(job_id, unit["unit"], "a")
+    assert not journal.renew_lease(job_id, unit["unit"], "b")
+    assert journal.lease_unit("b")["unit"] != unit["unit"]
+    assert journal.lease_unit("c") is None
+
+
+def test_expired_lease_is_leased_again_until_the_attempt_limit(monkeypatch, journal):
+    job_id = journal.create_job(["https://a.com"], {})
+    monkeypatch.setattr(jobs, "JOB_STALE_AFTER", -1)  # Every lease has expired by the next call
+    for attempt in range(1, JOB_MAX_ATTEMPTS + 1):
+        unit = journal.lease_unit(f"w{attempt}")
+        assert (unit["unit"], unit["attempts"]) == (0, attempt)
+    assert journal.lease_unit("w") is None
+    job = journal.get_job(job_id)
+    assert job["status"] == "failed"
+    assert "lease" in job["error"]
+
+
+def test_released_unit_fails_the_job_after_the_attempt_limit(journal):
+    job_id = journal.create_job(["https://a.com"], {})
+    for attempt in range(JOB_MAX_ATTEMPTS):
+        assert journal.get_job(job_id)["status"] in ("queued", "running")
+        unit = journal.lease_unit("w")
+        journal.release_unit(job_id, unit["unit"], "w", error="boom")
+    assert journal.get_job(job_id)["status"] == "failed"
+    assert journal.lease_unit("w") is None
+
+
+def test_rows_sharing_a_key_in_later_units_are_filled_before_the_job_is_done(journal):
+    websites = ["https://a.com", "https://b.com", "https://www.a.com", "https://a.com/contact", "https://c.com"]
+    job_id = journal.create_job(websites, {}, unit_size=2)
+    first = journal.lease_unit("w1")
+    second = journal.lease_unit("w2")
+    third = journal.lease_unit("w3")
+    # Only the first row of each domain is handed out
+    assert first["sites"] == [(0, "https://a.com"), (1, "https://b.com")]
+    assert second["sites"] == []
+    assert third["sites"] == [(4, "https://c.com")]
+
+    journal.complete_unit(job_id, second["unit"], "w2")
+    journal.record_site(job_id, 4, [], worker="w3")
+    journal.complete_unit(job_id, third["unit"], "w3")
+    assert journal.get_job(job_id)["status"] == "running"
+
+    assert journal.record_site(job_id, 0, ["hi@a.com"], worker="w1") == 2
+    assert journal.record_site(job_id, 1, ["hi@b.com"], worker="w1") == 0
+    journal.complete_unit(job_id, first["unit"], "w1")
+    job = journal.get_job(job_id)
+    assert (job["status"], job["done"]) == ("done", 5)
+    assert list(journal.iter_job_results(job_id)) == [
+        ("https://a.com", ["hi@a.com"]), ("https://b.com", ["hi@b.com"]), ("https://www.a.com", ["hi@a.com"]),
+        ("https://a.com/contact", ["hi@a.com"]), ("https://c.com", [])]
+
+
+def test_rows_are_not_shared_without_domain_grouping(journal):
+    job_id = journal.create_job(["https://a.com", "https://www.a.com"], {"group_domains": False})
+    unit = journal.lease_unit("w")
+    assert [index for index, website in unit["sites"]] == [0, 1]
+    assert journal.record_site(job_id, 0, ["hi@a.com"]) == 0